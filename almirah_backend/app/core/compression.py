@@ -0,0 +1,242 @@
+"""
+Negotiated gzip / Brotli compression.
+
+- CompressionMiddleware compresses API responses of a compressible type
+  (JSON, text, SVG, ...) above COMPRESSION_MIN_SIZE, picking Brotli over
+  gzip when the client accepts both. Responses that already carry a
+  Content-Encoding pass through untouched.
+- Cacheable catalog responses are compressed once per encoding and kept with
+  the cached body (see conditional_json_response), so a hot catalog page is
+  not recompressed on every request.
+- Static files get precompressed .br/.gz siblings (CatalogStaticFiles,
+  `python -m app.manage precompress-static`).
+
+Brotli needs the optional `brotli` package; without it only gzip is offered.
+"""
+import gzip
+import mimetypes
+import zlib
+from pathlib import Path
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Preferred first
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# File suffix of the precompressed sibling for each encoding
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+# Cached catalog bodies are compressed once and served many times, so they
+# get a higher (slower, smaller) setting than on-the-fly compression
+CACHED_BROTLI_QUALITY = 9
+CACHED_GZIP_LEVEL = 9
+
+
+# Server-sent events must reach the client as they are written, not when a
+# compressor block fills up
+NEVER_COMPRESSED_TYPES = ("text/event-stream",)
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return (
+        bool(content_type)
+        and content_type.startswith(COMPRESSIBLE_TYPES)
+        and not content_type.startswith(NEVER_COMPRESSED_TYPES)
+    )
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Best encoding we support from an Accept-Encoding header, or None.
+    Honours q-values (q=0 refuses an encoding); ties go to our preference order.
+    """
+    if not accept_encoding:
+        return None
+
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    """Compress a whole body; `cached` trades CPU for size on bodies that are reused."""
+    if encoding == "br":
+        quality = CACHED_BROTLI_QUALITY if cached else config.COMPRESSION_BROTLI_QUALITY
+        return brotli.compress(body, quality=quality)
+    level = CACHED_GZIP_LEVEL if cached else config.COMPRESSION_GZIP_LEVEL
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def precompress_directory(directory: Path) -> list[Path]:
+    """
+    Write maximum-compression .br and .gz siblings for every compressible file
+    under `directory` whose sibling is missing or older than the file.
+    Siblings that would not be smaller than the file are skipped.
+    Returns the written paths.
+    """
+    written = []
+    suffixes = tuple(ENCODING_SUFFIXES.values())
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.name.endswith(suffixes):
+            continue
+        media_type, _ = mimetypes.guess_type(path.name)
+        if not is_compressible(media_type):
+            continue
+
+        body = None
+        for encoding in SUPPORTED_ENCODINGS:
+            sibling = path.with_name(path.name + ENCODING_SUFFIXES[encoding])
+            if sibling.exists() and sibling.stat().st_mtime >= path.stat().st_mtime:
+                continue
+            body = body if body is not None else path.read_bytes()
+            if encoding == "br":
+                compressed = brotli.compress(body, quality=11)
+            else:
+                compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                sibling.write_bytes(compressed)
+                written.append(sibling)
+    return written
+
+
+def add_vary(headers: MutableHeaders) -> None:
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding"
+
+
+def weaken_etag(headers: MutableHeaders) -> None:
+    """
+    A strong ETag names exact bytes; once the body is compressed on the fly it
+    only identifies the content, so it is sent as a weak ETag.
+    """
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class _StreamCompressor:
+    """Incremental compressor for streamed (multi-message) bodies."""
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=config.COMPRESSION_BROTLI_QUALITY)
+            self.compress = self._compressor.process
+            self.flush = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress = self._compressor.compress
+            self.flush = self._compressor.flush
+
+
+class CompressionMiddleware:
+    """Pure ASGI gzip/Brotli compression of responses above a size threshold."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        stream: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, stream, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                passthrough = (
+                    "content-encoding" in headers
+                    or not is_compressible(headers.get("content-type"))
+                    or message["status"] in (204, 206, 304)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # Hold the start until the first body chunk tells us the size
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if not more_body:
+                    # Whole body in one message (the usual API response)
+                    if len(body) < self.minimum_size:
+                        passthrough = True
+                        await send(start_message)
+                        await send(message)
+                        return
+                    body = compress(body, encoding)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    add_vary(headers)
+                    weaken_etag(headers)
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+                # Streaming response (e.g. a static file): compress chunk by chunk
+                stream = _StreamCompressor(encoding)
+                headers["Content-Encoding"] = encoding
+                add_vary(headers)
+                del headers["Content-Length"]
+                weaken_etag(headers)
+                await send(start_message)
+                start_message = None
+
+            chunk = stream.compress(body)
+            if not more_body:
+                chunk += stream.flush()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
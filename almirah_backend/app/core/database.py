@@ -1,26 +1,196 @@
-from sqlmodel import SQLModel, create_engine, Session
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import config
+from app.core.metrics import instrument_engine
 
 # Import models to ensure they're registered with SQLModel metadata
-from app.models import product, category, user, cart_item
+from app.models import (
+    product, category, user, cart_item, bag_summary, stock_reservation, change_event, similar_product
+)
+from app.models.product import REPLACED_INDEXES
+from app.services.cart_service import CartService
+from app.services.category_service import CategoryService
+from app.services.change_feed_service import ChangeFeedService
+from app.services.search_service import SearchService
 
 # 1. The Connection String
-# For now, we use a simple SQLite file named "almirah.db"
-sqlite_file_name = "almirah.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+# Defaults to a simple SQLite file named "almirah.db"; set DATABASE_URL to use
+# another file or another database (e.g. Postgres)
+database_url = config.DATABASE_URL
+
+# Async driver used for each database when serving requests
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+def to_async_url(url: str) -> str:
+    """Swap the driver of a database URL for its asyncio counterpart."""
+    url_object = make_url(url)
+    driver = ASYNC_DRIVERS.get(url_object.get_backend_name())
+    if driver is None or url_object.get_driver_name() == driver:
+        return url
+    return url_object.set(drivername=f"{url_object.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+async_database_url = config.ASYNC_DATABASE_URL or to_async_url(database_url)
+
+# PRAGMAs applied to every new SQLite connection (see app/core/config.py)
+SQLITE_PRAGMAS = {
+    "journal_mode": config.SQLITE_JOURNAL_MODE,
+    "synchronous": config.SQLITE_SYNCHRONOUS,
+    "mmap_size": config.SQLITE_MMAP_SIZE,
+    "cache_size": config.SQLITE_CACHE_SIZE,
+    "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+}
+
+# 2. The Engines (The actual connection managers)
+# The async engine serves API requests; the sync engine is used for startup
+# DDL, maintenance commands (app/manage.py) and benchmarks
+def _engine_kwargs(url: str) -> dict:
+    """Pool and driver options from app/core/config.py for `url`."""
+    url_object = make_url(url)
+    pool_kwargs = {
+        "pool_size": config.DATABASE_POOL_SIZE,
+        "max_overflow": config.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": config.DATABASE_POOL_TIMEOUT,
+    }
+    if url_object.get_backend_name() != "sqlite":
+        return {**pool_kwargs, "pool_recycle": config.DATABASE_POOL_RECYCLE, "pool_pre_ping": True}
+
+    # connect_args={"check_same_thread": False} is needed only for SQLite
+    engine_kwargs = {"connect_args": {"check_same_thread": False}}
+    if url_object.database not in (None, "", ":memory:"):
+        engine_kwargs.update(pool_kwargs)
+    return engine_kwargs
+
+def _apply_sqlite_pragmas(sync_engine: Engine, sqlite_pragmas: Optional[dict]) -> None:
+    """Run the given PRAGMAs on every new SQLite connection of `sync_engine`."""
+    if sync_engine.dialect.name != "sqlite" or not sqlite_pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def make_engine(
+    url: str = database_url,
+    echo: bool = config.DATABASE_ECHO,
+    sqlite_pragmas: Optional[dict] = SQLITE_PRAGMAS
+) -> Engine:
+    """
+    Build a sync engine for `url`, configured from app/core/config.py.
+    SQLite gets the given PRAGMAs on every connection; other databases get
+    a sized connection pool.
+    """
+    sync_engine = create_engine(url, echo=echo, **_engine_kwargs(url))
+    _apply_sqlite_pragmas(sync_engine, sqlite_pragmas)
+    return sync_engine
 
-# 2. The Engine (The actual connection manager)
-# connect_args={"check_same_thread": False} is needed only for SQLite
-engine = create_engine(sqlite_url, echo=True, connect_args={"check_same_thread": False})
+def make_async_engine(
+    url: str = async_database_url,
+    echo: bool = config.DATABASE_ECHO,
+    sqlite_pragmas: Optional[dict] = SQLITE_PRAGMAS
+) -> AsyncEngine:
+    """Async counterpart of make_engine (aiosqlite locally, asyncpg for Postgres)."""
+    async_engine = create_async_engine(url, echo=echo, **_engine_kwargs(url))
+    _apply_sqlite_pragmas(async_engine.sync_engine, sqlite_pragmas)
+    return async_engine
 
-# 3. Function to create tables (Run this on startup)
+engine = make_engine()
+async_engine = make_async_engine()
+
+# Query count and DB time for GET /metrics
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+# 3. Function to add columns that were added to a model after its table was created
+def add_missing_columns(connection):
+    """
+    Lightweight migration for existing almirah.db files: ALTER TABLE ... ADD COLUMN
+    for every model column the table does not have yet.
+    Only suitable for nullable (or defaulted) columns, which is all we add.
+    """
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+
+# 3b. Data fix needed before the unique (user_id, product_id) cart index can be built
+def merge_duplicate_cart_items(connection):
+    """
+    Older almirah.db files may hold several CartItem rows for the same user and
+    product. Fold each group into its oldest row (quantities summed) and delete the rest.
+    """
+    if inspect(connection).has_index("cartitem", "ux_cartitem_user_id_product_id"):
+        return
+    connection.execute(text("""
+        UPDATE cartitem SET quantity = (
+            SELECT SUM(duplicate.quantity) FROM cartitem AS duplicate
+            WHERE duplicate.user_id = cartitem.user_id AND duplicate.product_id = cartitem.product_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM cartitem GROUP BY user_id, product_id HAVING COUNT(*) > 1
+        )
+    """))
+    connection.execute(text("""
+        DELETE FROM cartitem WHERE id NOT IN (
+            SELECT MIN(id) FROM cartitem GROUP BY user_id, product_id
+        )
+    """))
+
+# 3c. Function to create tables (Run this on startup)
 def create_db_and_tables():
     # Only create tables if they don't exist
     # This preserves existing data when the server restarts
     # For schema changes in development, manually delete almirah.db
     SQLModel.metadata.create_all(engine)
 
+    with engine.begin() as connection:
+        add_missing_columns(connection)
+        merge_duplicate_cart_items(connection)
+
+        # Products now point at their category by id: link existing rows and
+        # drop the old indexes on the category name
+        CategoryService.link_products(connection)
+        for index_name in REPLACED_INDEXES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+        # create_all() only builds indexes together with new tables, so indexes
+        # added to a model later are created here for existing almirah.db files
+        # (IF NOT EXISTS, because reflection cannot see expression indexes)
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+        # Full-text search index over products (backfilled on first creation)
+        SearchService.create_index(connection)
+
+        # Drops materialized bag totals when a product price changes
+        CartService.create_summary_trigger(connection)
+
+        # Change feed: every product/category/bag write appends an event
+        ChangeFeedService.create_triggers(connection)
+
 # 4. Dependency (The "Session")
-# Every API request gets its own temporary connection session
-def get_session():
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+# Every API request gets its own temporary connection session.
+# expire_on_commit=False: attributes stay loaded after commit, because lazy
+# reloading is not possible outside of an await
+async def get_session() -> AsyncIterator[AsyncSession]:
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,94 @@
+import hashlib
+from typing import Hashable, Optional
+
+from fastapi import Request, Response
+
+from app.core import config
+from app.core.compression import compress, negotiate
+
+
+def make_etag(*parts: Hashable) -> str:
+    """
+    Strong ETag from what identifies a representation (e.g. the catalog
+    version and the request's cache key), so no body is needed to compute it.
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Evaluate an If-None-Match header against our ETag.
+    If-None-Match uses weak comparison, so a W/ prefix on the client's tag is ignored.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def not_modified_response(
+    request: Request,
+    etag: str,
+    cache_control: str = config.CATALOG_CACHE_CONTROL
+) -> Optional[Response]:
+    """
+    The 304 Not Modified for a request whose If-None-Match already names
+    `etag` as conditional_json_response would tag it for this request, or
+    None (build the response as usual). Lets a route answer before running
+    any query. The plain tag (a body too small to compress) fits any
+    Accept-Encoding; a suffixed one only the coding this request would get.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match or if_none_match.strip() == "*":
+        return None
+    encoding = negotiate(request.headers.get("accept-encoding")) or "identity"
+    for candidate in (etag, f'{etag[:-1]}-{encoding}"'):
+        if etag_matches(if_none_match, candidate):
+            return Response(
+                status_code=304,
+                headers={"ETag": candidate, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+            )
+    return None
+
+
+def conditional_json_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    headers: Optional[dict] = None,
+    cache_control: str = config.CATALOG_CACHE_CONTROL,
+    encoded: Optional[dict[str, bytes]] = None
+) -> Response:
+    """
+    Build a JSON response carrying ETag and Cache-Control, or an empty
+    304 Not Modified if the client already holds this exact representation.
+    With `encoded` (the memo of a cached body, CacheEntry.encoded), the body
+    is compressed for the client's Accept-Encoding once and reused after that;
+    each encoding of such a body (identity included) is its own representation
+    with its own ETag, while a body too small to compress keeps the plain one.
+    """
+    encoding = None
+    if encoded is not None and len(body) >= config.COMPRESSION_MIN_SIZE:
+        encoding = negotiate(request.headers.get("accept-encoding")) or "identity"
+    if encoding:
+        etag = f'{etag[:-1]}-{encoding}"'
+
+    validator_headers = {"ETag": etag, "Cache-Control": cache_control}
+    if encoded is not None:
+        validator_headers["Vary"] = "Accept-Encoding"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=validator_headers)
+
+    if encoding and encoding != "identity":
+        if encoding not in encoded:
+            encoded[encoding] = compress(body, encoding, cached=True)
+        body = encoded[encoding]
+        validator_headers["Content-Encoding"] = encoding
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={**(headers or {}), **validator_headers}
+    )
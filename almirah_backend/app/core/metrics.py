@@ -0,0 +1,270 @@
+"""
+In-process request and database metrics, exposed in Prometheus text format.
+
+MetricsMiddleware times every request and labels it with its route template
+(e.g. /products/{product_id}, never the raw path, so label cardinality stays
+bounded). SQLAlchemy engine events count the queries and the time spent in
+the database, both in total and per request. Rendered by GET /metrics.
+
+Metrics are per process: with several workers, scrape each one (or run one
+worker per scrape target).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Label used for requests that matched no route (404s, scanners),
+# so that arbitrary paths never become label values
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter (or, with dec(), a gauge) per label set."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), kind: str = "counter"):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.kind = kind
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, *label_values, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set (Prometheus semantics)."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket (+Inf last), sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        # Buckets are stored non-cumulative and summed up when rendering,
+        # so an observation is one bisect and two additions
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(label_values, list(counts), total) for label_values, (counts, total) in self._series.items()]
+        for label_values, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {total:g}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+http_requests_total = Counter(
+    "http_requests_total", "Requests served, by route and status code.", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "Request latency, by route.", ("method", "route"), LATENCY_BUCKETS
+)
+http_requests_in_progress = Counter(
+    "http_requests_in_progress", "Requests being served right now.", kind="gauge"
+)
+http_request_db_queries = Histogram(
+    "http_request_db_queries", "SQL statements issued per request, by route.", ("method", "route"), QUERY_COUNT_BUCKETS
+)
+http_request_db_duration_seconds = Histogram(
+    "http_request_db_duration_seconds", "Time spent in the database per request, by route.",
+    ("method", "route"), LATENCY_BUCKETS
+)
+db_queries_total = Counter("db_queries_total", "SQL statements issued (requests and background work).")
+db_query_duration_seconds_total = Counter(
+    "db_query_duration_seconds_total", "Time spent executing SQL statements (requests and background work)."
+)
+
+REGISTRY = (
+    http_requests_total,
+    http_request_duration_seconds,
+    http_requests_in_progress,
+    http_request_db_queries,
+    http_request_db_duration_seconds,
+    db_queries_total,
+    db_query_duration_seconds_total,
+)
+
+
+class RequestDbStats:
+    """Queries issued and time spent in the database by the current request."""
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Set by the middleware for the duration of a request, read by the engine events
+_request_db_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("request_db_stats", default=None)
+
+
+# Set while a request is being profiled (app/core/profiling.py): every statement is logged
+_statement_log: ContextVar[Optional[list]] = ContextVar("statement_log", default=None)
+
+
+def current_db_stats() -> Optional[RequestDbStats]:
+    """Database stats of the request being served, None outside of a request."""
+    return _request_db_stats.get()
+
+
+@contextmanager
+def record_statements() -> Iterator[list[tuple[str, float]]]:
+    """Collect (SQL, seconds) for every statement run in this context."""
+    log: list[tuple[str, float]] = []
+    token = _statement_log.set(log)
+    try:
+        yield log
+    finally:
+        _statement_log.reset(token)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Count the statements run on `engine` and time them (pass
+    async_engine.sync_engine for an AsyncEngine). Two clock reads and two
+    counter updates per statement.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        db_queries_total.inc()
+        db_query_duration_seconds_total.inc(amount=elapsed)
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+        log = _statement_log.get()
+        if log is not None:
+            log.append((statement, elapsed))
+
+
+def route_label(scope: Scope) -> str:
+    """
+    Route template of a routed request, e.g. /products/{product_id}/stock.
+    Rebuilt from the path and the matched path parameters, which works the
+    same for app routes, included routers and mounts (/static/{path}).
+    """
+    if scope.get("route") is None:
+        return UNMATCHED_ROUTE
+
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        value = str(value)
+        if path.endswith("/" + value):
+            # Last parameter, possibly several segments long (a mount's {path})
+            path = f"{path[:-len(value)]}{{{name}}}"
+        elif f"/{value}/" in path:
+            path = path.replace(f"/{value}/", f"/{{{name}}}/", 1)
+        else:
+            # Converted value not found verbatim (e.g. /products/007): never
+            # use the raw path as a label
+            return getattr(scope["route"], "path", UNMATCHED_ROUTE)
+    return path
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware task/stream overhead) that
+    records latency, status, in-flight count and database work of each request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500  # If the app raises before sending a response
+        stats = RequestDbStats()
+        token = _request_db_stats.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_progress.dec()
+            _request_db_stats.reset(token)
+
+            route = route_label(scope)
+            method = scope["method"]
+            http_requests_total.inc(method, route, status_code)
+            http_request_duration_seconds.observe(elapsed, method, route)
+            http_request_db_queries.observe(stats.queries, method, route)
+            http_request_db_duration_seconds.observe(stats.seconds, method, route)
@@ -0,0 +1,181 @@
+"""
+Opt-in profiling of single requests in production.
+
+With PROFILING_ENABLED, ProfilingMiddleware profiles a request when it
+carries a valid X-Profile token (an expiring HMAC signed with
+PROFILING_SECRET, made with `python -m app.manage profile-token`) or when it
+is picked at PROFILING_SAMPLE_RATE. The request runs under cProfile while
+every SQL statement is logged with its duration. Each profile is saved in
+PROFILING_DIR as:
+  <name>.prof  raw cProfile data (pstats, snakeviz, ...)
+  <name>.txt   report: request, SQL statements with timings, top functions
+and its name is returned in the X-Profile-Id response header. Profiles are
+listed and downloaded through GET /profiles (same token required).
+
+When profiling is disabled the middleware is not installed at all; when it
+is enabled, a request that is not profiled costs one header lookup and one
+random number.
+
+Caveats: cProfile sees the event loop thread only (sync endpoints run in the
+threadpool are timed as a whole through the awaiting code), and coroutines of
+other requests interleaved on the loop show up in the profile too. Only one
+request per process is profiled at a time.
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import config
+from app.core.metrics import record_statements, route_label
+
+PROFILE_HEADER = "x-profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Functions listed in the text report
+REPORT_TOP_FUNCTIONS = 60
+
+PROFILE_NAME = re.compile(r"^[\w.-]+\.(prof|txt)$")
+
+# cProfile cannot run two profilers at once in one thread (the event loop)
+_profile_lock = threading.Lock()
+
+
+def make_token(secret: str, ttl_seconds: int) -> str:
+    """X-Profile token valid for `ttl_seconds`: "<expiry unix time>.<hmac-sha256>"."""
+    expires = int(time.time()) + ttl_seconds
+    signature = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def verify_token(secret: Optional[str], token: Optional[str]) -> bool:
+    """True if `token` was signed with `secret` and has not expired."""
+    if not secret or not token:
+        return False
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(secret.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def save_profile(
+    profiler: cProfile.Profile,
+    name: str,
+    request_line: str,
+    status_code: int,
+    elapsed: float,
+    statements: list[tuple[str, float]]
+) -> None:
+    """Write <name>.prof and <name>.txt to PROFILING_DIR and prune old profiles (blocking)."""
+    directory = Path(config.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(directory / f"{name}.prof")
+
+    report = io.StringIO()
+    sql_seconds = sum(seconds for _, seconds in statements)
+    report.write(f"{request_line} -> {status_code} in {elapsed * 1000:.1f} ms\n")
+    report.write(f"{len(statements)} SQL statements, {sql_seconds * 1000:.1f} ms in the database\n\n")
+    for index, (statement, seconds) in enumerate(statements, 1):
+        report.write(f"-- #{index} {seconds * 1000:.2f} ms\n{statement.strip()}\n\n")
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_TOP_FUNCTIONS)
+    (directory / f"{name}.txt").write_text(report.getvalue())
+
+    profiles = sorted(directory.glob("*.prof"), key=lambda path: path.stat().st_mtime)
+    for path in profiles[:max(0, len(profiles) - config.PROFILING_MAX_FILES)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".txt").unlink(missing_ok=True)
+
+
+def list_profiles() -> list[dict]:
+    """Saved profiles, newest first."""
+    directory = Path(config.PROFILING_DIR)
+    if not directory.is_dir():
+        return []
+    profiles = sorted(directory.glob("*.prof"), key=lambda path: path.stat().st_mtime, reverse=True)
+    return [
+        {"id": path.stem, "created_at": path.stat().st_mtime, "files": [path.name, f"{path.stem}.txt"]}
+        for path in profiles
+    ]
+
+
+def profile_path(filename: str) -> Optional[Path]:
+    """Path of a saved profile file, None for unknown or unsafe names."""
+    if not PROFILE_NAME.match(filename):
+        return None
+    path = Path(config.PROFILING_DIR) / filename
+    return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    """Profiles the requests selected by a signed X-Profile header or by sampling."""
+
+    def __init__(self, app: ASGIApp, secret: Optional[str] = None, sample_rate: float = 0.0):
+        self.app = app
+        self.secret = secret
+        self.sample_rate = sample_rate
+
+    def should_profile(self, scope: Scope) -> bool:
+        token = _header(scope, PROFILE_HEADER.encode()) if self.secret else None
+        if token is not None:
+            return verify_token(self.secret, token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if not _profile_lock.acquire(blocking=False):
+            # Another request of this process is being profiled
+            await self.app(scope, receive, send)
+            return
+
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method'].lower()}-{uuid.uuid4().hex[:8]}"
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (PROFILE_ID_HEADER.lower().encode(), name.encode()),
+                ]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with record_statements() as statements:
+                profiler.enable()
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    profiler.disable()
+        finally:
+            _profile_lock.release()
+
+        elapsed = time.perf_counter() - started
+        query = f"?{scope['query_string'].decode('latin-1')}" if scope.get("query_string") else ""
+        request_line = f"{scope['method']} {scope['path']}{query} [{route_label(scope)}]"
+        # The response has been sent: write the files off the event loop
+        await run_in_threadpool(save_profile, profiler, name, request_line, status_code, elapsed, statements)
@@ -0,0 +1,80 @@
+"""
+Fast JSON encoding for API responses.
+
+FastJSONResponse (orjson) is the app's default response class. The hot list
+endpoints go further and skip FastAPI's response_model pass entirely
+(re-validating every row, then jsonable_encoder, then encoding): dump_rows
+reads the public schema's fields straight off the query results and encodes
+them in one orjson call. The JSON is the same as the schema would produce,
+field order included, so clients see no difference.
+
+Sparse fieldsets (?fields=id,name,price) narrow that to a subset of the
+schema's fields; see parse_fields.
+"""
+from functools import lru_cache
+from typing import Any, Iterable, Optional, Sequence
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+
+# Non-str dict keys: image_variants and similar JSON columns may hold int keys
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson (datetimes, dataclasses etc. handled natively)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def public_fields(schema: type) -> tuple[str, ...]:
+    """Field names of a public schema (e.g. ProductPublic), in declaration order."""
+    return tuple(schema.model_fields)
+
+
+def parse_fields(schema: type, fields: Optional[str], always: Sequence[str] = ("id",)) -> Optional[tuple[str, ...]]:
+    """
+    Fields selected by a ?fields=a,b,c parameter, in the schema's order and
+    including `always` (the id clients need to act on a row).
+    None when no selection was given (all fields). Raises 400 on unknown fields.
+    """
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested.difference(public_fields(schema))
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {sorted(unknown)}; available: {list(public_fields(schema))}"
+        )
+    requested.update(always)
+    return tuple(field for field in public_fields(schema) if field in requested)
+
+
+def public_dict(schema: type, row: Any) -> dict:
+    """The fields of `schema` read off one row, unvalidated (see dump_rows)."""
+    return {field: getattr(row, field) for field in public_fields(schema)}
+
+
+def dump_rows(schema: type, rows: Iterable[Any], fields: Optional[Sequence[str]] = None) -> bytes:
+    """
+    Encode ORM objects (or Row results, or already-built schema instances) as
+    a JSON list shaped like list[schema], without validating them again.
+    Only for rows that already satisfy the schema: DB rows of its table or
+    objects the services built from it. `fields` (see parse_fields) keeps
+    only those fields.
+    """
+    fields = fields or public_fields(schema)
+    return dumps([{field: getattr(row, field) for field in fields} for row in rows])
+
+
+def raw_json_response(body: bytes | str, **kwargs) -> Response:
+    """Response for an already-encoded JSON body (FastAPI then skips response_model)."""
+    return Response(content=body, media_type="application/json", **kwargs)
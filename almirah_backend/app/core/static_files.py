@@ -0,0 +1,81 @@
+import mimetypes
+import os
+import stat
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.core.compression import ENCODING_SUFFIXES, is_compressible, negotiate
+from app.services.media_service import CONTENT_ADDRESSED_NAME
+
+# Content-addressed files never change under the same name, so clients and CDNs
+# may keep them for a year without revalidating
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class CatalogStaticFiles(StaticFiles):
+    """
+    StaticFiles that marks content-addressed images as immutable and serves
+    precompressed siblings: a request for app.css from a client accepting
+    Brotli gets app.css.br if it exists (see `python -m app.manage
+    precompress-static`), so nothing is compressed per request.
+    Starlette's FileResponse handles Range requests (resumable and partial
+    image downloads) and If-None-Match / If-Modified-Since revalidation.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        media_type, _ = mimetypes.guess_type(path)
+        # Byte ranges always refer to the identity file
+        if scope["method"] in ("GET", "HEAD") and is_compressible(media_type) and "range" not in request_headers:
+            encoding = negotiate(request_headers.get("accept-encoding"))
+            if encoding:
+                response = await self.precompressed_response(path, encoding, media_type, scope)
+                if response is not None:
+                    return response
+
+        response = await super().get_response(path, scope)
+        if is_compressible(media_type):
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    async def precompressed_response(self, path: str, encoding: str, media_type: str, scope: Scope):
+        """The <path>.br / <path>.gz sibling for `encoding`, or None if there is none."""
+        try:
+            full_path, stat_result = await anyio.to_thread.run_sync(
+                self.lookup_path, path + ENCODING_SUFFIXES[encoding]
+            )
+        except (OSError, ValueError):
+            return None
+        if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+            return None
+
+        response = FileResponse(
+            full_path,
+            stat_result=stat_result,
+            media_type=media_type,
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+        )
+        self.set_cache_control(response, path)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def file_response(
+        self,
+        full_path: "os.PathLike[str] | str",
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        self.set_cache_control(response, full_path)
+        return response
+
+    @staticmethod
+    def set_cache_control(response: Response, path: "os.PathLike[str] | str") -> None:
+        if CONTENT_ADDRESSED_NAME.match(os.path.basename(path)):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
@@ -1,16 +1,39 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
-from app.core.database import create_db_and_tables
-from app.routers import products, categories, cart, users # Import the routers
+from contextlib import asynccontextmanager, suppress
+from app.core import compression, config, metrics, profiling
+from app.core.database import async_engine, create_db_and_tables, engine
+from app.core.serialization import FastJSONResponse
+from app.core.static_files import CatalogStaticFiles
+from app.routers import products, categories, cart, users, profiles, events # Import the routers
+from app.services.catalog_cache import catalog_cache
+from app.services.change_feed_service import ChangeFeedService, change_broadcaster
+from app.services.inventory_service import InventoryService
+from app.services.similarity_service import SimilarityService
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    # Background work: put the stock of expired bag reservations back on
+    # sale, push new change events to SSE clients, prune old events, fill
+    # the similar-products index if it is empty
+    background_tasks = [
+        asyncio.create_task(InventoryService.run_sweeper(async_engine, config.STOCK_SWEEP_INTERVAL_SECONDS)),
+        asyncio.create_task(change_broadcaster.run(async_engine, config.CHANGE_FEED_POLL_INTERVAL_SECONDS)),
+        asyncio.create_task(ChangeFeedService.run_pruner(async_engine, config.CHANGE_FEED_PRUNE_INTERVAL_SECONDS)),
+        asyncio.create_task(SimilarityService.run_backfill(engine)),
+    ]
     yield
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+    await async_engine.dispose()
 
-app = FastAPI(lifespan=lifespan)
+# orjson for every JSON response (list endpoints send pre-encoded bodies, see app/core/serialization.py)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Create static directory structure if it doesn't exist
 from pathlib import Path
@@ -18,7 +41,8 @@ static_dir = Path("static/images")
 static_dir.mkdir(parents=True, exist_ok=True)
 
 # Serve static files from the "static" directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# (content-addressed images are sent with far-future, immutable caching)
+app.mount("/static", CatalogStaticFiles(directory="static"), name="static")
 
 # Add CORS middleware to allow frontend requests
 app.add_middleware(
@@ -29,15 +53,46 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the pagination cursor of GET /products/
+    # and the id of a profiled request
+    expose_headers=["X-Next-Cursor", profiling.PROFILE_ID_HEADER],
 )
 
+# gzip/Brotli for responses above COMPRESSION_MIN_SIZE (catalog pages and
+# precompressed static files arrive already encoded and pass through)
+app.add_middleware(compression.CompressionMiddleware, minimum_size=config.COMPRESSION_MIN_SIZE)
+
+# Opt-in per-request profiling (see app/core/profiling.py); not installed unless enabled
+if config.PROFILING_ENABLED:
+    app.add_middleware(
+        profiling.ProfilingMiddleware,
+        secret=config.PROFILING_SECRET,
+        sample_rate=config.PROFILING_SAMPLE_RATE
+    )
+
+# Per-route latency, status, in-flight and DB metrics (GET /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Register the routers
 # prefix="/products" means all endpoints in that file will start with /products
 app.include_router(products.router, prefix="/products", tags=["Products"])
 app.include_router(categories.router, prefix="/categories", tags=["Categories"])
 app.include_router(cart.router, prefix="/cart", tags=["Cart"])
 app.include_router(users.router, prefix="/users", tags=["Users"])
+app.include_router(events.router, prefix="/events", tags=["Events"])
+if config.PROFILING_ENABLED:
+    app.include_router(profiles.router, prefix="/profiles", tags=["Monitoring"])
 
 @app.get("/")
 def read_root():
-    return {"message": "Almirah API is running"}
\ No newline at end of file
+    return {"message": "Almirah API is running"}
+
+@app.get("/cache/stats", tags=["Monitoring"])
+def read_cache_stats():
+    """Hit/miss/eviction counters and size of the catalog read cache"""
+    return catalog_cache.stats()
+
+@app.get("/metrics", tags=["Monitoring"], include_in_schema=False)
+def read_metrics():
+    """Request and database metrics in Prometheus text format"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,148 @@
+"""
+Maintenance commands for the Almirah backend.
+
+Run from the almirah_backend directory (next to almirah.db), e.g.:
+    python -m app.manage rebuild-search-index
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from sqlmodel import Session, select
+
+from app.core import config
+from app.core.database import engine, create_db_and_tables
+from app.core.compression import precompress_directory
+from app.core.profiling import make_token
+from app.models.category import Category
+from app.models.product import Product
+from app.services.import_service import DEFAULT_BATCH_SIZE, FORMATS, ProductImportService, detect_format
+from app.services.media_service import MediaService
+from app.services.search_service import SearchService
+from app.services.similarity_service import SimilarityService
+
+
+def rebuild_search_index(args: argparse.Namespace) -> None:
+    """Backfill or repair the product full-text search index."""
+    create_db_and_tables()
+    with engine.begin() as connection:
+        SearchService.rebuild_index(connection)
+    print("Search index rebuilt")
+
+
+def build_similar(args: argparse.Namespace) -> None:
+    """Rebuild the similar-products index (GET /products/{id}/similar) from scratch."""
+    create_db_and_tables()
+    indexed = SimilarityService.build_index(engine, args.k)
+    print(f"Similar products index built for {indexed} products")
+
+
+def generate_image_variants(args: argparse.Namespace) -> None:
+    """Create thumbnails/WebP variants for products and categories that have none."""
+    create_db_and_tables()
+    with Session(engine) as session:
+        for model in (Product, Category):
+            rows = session.exec(select(model).where(model.image_variants.is_(None))).all()
+            for row in rows:
+                row.image_variants = MediaService.generate_variants(row.image_url)
+                session.add(row)
+            session.commit()
+            print(f"{model.__name__}: processed {len(rows)} images")
+
+
+def gc_images(args: argparse.Namespace) -> None:
+    """Delete uploaded images no longer referenced by any product or category."""
+    create_db_and_tables()
+    referenced = []
+    with Session(engine) as session:
+        for model in (Product, Category):
+            for image_url, image_variants in session.exec(select(model.image_url, model.image_variants)):
+                referenced.append(image_url)
+                referenced.extend((image_variants or {}).values())
+
+    removed = MediaService.collect_garbage(
+        referenced,
+        min_age_seconds=args.min_age_minutes * 60,
+        dry_run=args.dry_run
+    )
+    for path in removed:
+        print(f"{'would remove' if args.dry_run else 'removed'} {path}")
+    print(f"{len(removed)} unreferenced files {'found' if args.dry_run else 'removed'}")
+
+
+def import_products(args: argparse.Namespace) -> None:
+    """Bulk-import products from an NDJSON or CSV file."""
+    file_format = args.format or detect_format(args.file)
+    if file_format is None:
+        sys.exit("Cannot guess the file format, pass --format ndjson or --format csv")
+
+    create_db_and_tables()
+    with open(args.file, "rb") as source:
+        report = ProductImportService.import_file(engine, source, file_format, args.batch_size)
+
+    for error in report.errors:
+        print(f"row {error.row}: {'; '.join(error.errors)}", file=sys.stderr)
+    if report.errors_truncated:
+        print("(more errors not shown)", file=sys.stderr)
+    print(f"{report.inserted} inserted, {report.failed} failed, {report.batches} batches")
+    if report.inserted:
+        SimilarityService.build_index(engine)
+
+
+def precompress_static(args: argparse.Namespace) -> None:
+    """Write .br/.gz siblings of compressible static files (served instead of compressing per request)."""
+    written = precompress_directory(Path(args.directory))
+    for path in written:
+        print(f"wrote {path}")
+    print(f"{len(written)} precompressed files written")
+
+
+def profile_token(args: argparse.Namespace) -> None:
+    """Print an X-Profile header value that profiles requests (PROFILING_SECRET must be set)."""
+    if not config.PROFILING_SECRET:
+        sys.exit("PROFILING_SECRET is not set")
+    print(make_token(config.PROFILING_SECRET, int(args.ttl_minutes * 60)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.manage", description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-search-index", help=rebuild_search_index.__doc__)
+    rebuild.set_defaults(handler=rebuild_search_index)
+
+    similar = subparsers.add_parser("build-similar", help=build_similar.__doc__)
+    similar.add_argument("--k", type=int, default=None, help="neighbours per product (default SIMILAR_PRODUCTS_K)")
+    similar.set_defaults(handler=build_similar)
+
+    variants = subparsers.add_parser("generate-image-variants", help=generate_image_variants.__doc__)
+    variants.set_defaults(handler=generate_image_variants)
+
+    gc = subparsers.add_parser("gc-images", help=gc_images.__doc__)
+    gc.add_argument("--dry-run", action="store_true", help="only list the files that would be removed")
+    gc.add_argument(
+        "--min-age-minutes", type=float, default=60,
+        help="never remove files younger than this (uploads still in flight), default 60"
+    )
+    gc.set_defaults(handler=gc_images)
+
+    importer = subparsers.add_parser("import-products", help=import_products.__doc__)
+    importer.add_argument("file", help="path to a .ndjson/.jsonl or .csv file")
+    importer.add_argument("--format", choices=FORMATS, help="file format (guessed from the extension by default)")
+    importer.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per transaction")
+    importer.set_defaults(handler=import_products)
+
+    precompress = subparsers.add_parser("precompress-static", help=precompress_static.__doc__)
+    precompress.add_argument("--directory", default="static", help="directory mounted at /static, default static")
+    precompress.set_defaults(handler=precompress_static)
+
+    token = subparsers.add_parser("profile-token", help=profile_token.__doc__)
+    token.add_argument("--ttl-minutes", type=float, default=60, help="how long the token stays valid, default 60")
+    token.set_defaults(handler=profile_token)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
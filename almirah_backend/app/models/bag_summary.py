@@ -0,0 +1,16 @@
+from sqlmodel import Field, SQLModel
+from datetime import datetime
+
+class BagSummary(SQLModel, table=True):
+    """
+    Materialized totals of one user's bag, kept up to date by CartService on
+    every cart write so the bag badge never has to hydrate the items.
+    A missing row means "not computed yet" (or invalidated): it is rebuilt
+    from cartitem on the next read.
+    """
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    item_count: int = 0  # Number of distinct products (bag lines)
+    total_quantity: int = 0  # Sum of the quantities (what the badge shows)
+    total_mrp: float = 0.0
+    total_amount: float = 0.0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
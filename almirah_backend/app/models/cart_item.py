@@ -1,4 +1,5 @@
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 from datetime import datetime
 
@@ -11,3 +12,6 @@ class CartItem(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+# One row per product per bag: repeated adds change the quantity of the same row.
+# Backs the ON CONFLICT upserts in CartService.
+Index("ux_cartitem_user_id_product_id", CartItem.user_id, CartItem.product_id, unique=True)
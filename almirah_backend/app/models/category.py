@@ -1,8 +1,11 @@
 from typing import Optional
+from sqlalchemy import JSON, Column
 from sqlmodel import Field, SQLModel
 
 class Category(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    name: str
+    name: str = Field(index=True)
     image_url: str
+    # Resized/WebP copies of image_url, e.g. {"200w": "/static/images/..._200w.webp"}
+    image_variants: Optional[dict[str, str]] = Field(default=None, sa_column=Column(JSON))
 
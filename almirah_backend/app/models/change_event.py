@@ -0,0 +1,20 @@
+from typing import Optional
+from sqlmodel import Field, SQLModel
+from datetime import datetime
+
+class ChangeEvent(SQLModel, table=True):
+    """
+    One entry of the change feed: a product, category or bag line that was
+    created/updated ("upsert") or deleted. Written by database triggers (see
+    ChangeFeedService.create_triggers); `seq` only ever grows, so clients
+    resume with "everything after seq N".
+    """
+    # AUTOINCREMENT: seqs of pruned events are never handed out again
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    entity: str  # "product", "category" or "cart"
+    entity_id: int  # Product/category id; for "cart", the product id of the bag line
+    action: str  # "upsert" or "delete"
+    user_id: Optional[int] = None  # Owner of the bag, for "cart" events only
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)  # Indexed for pruning
@@ -1,13 +1,52 @@
 from typing import Optional
+from sqlalchemy import JSON, Column, Index, func
 from sqlmodel import Field, SQLModel
 
 class Product(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    brand: str
+    brand: str = Field(index=True)
     name: str
     description: Optional[str] = None
     price: float
     image_url: str
+    # Name of the category, kept next to category_id for display and search
+    # (CategoryService.rename updates both)
     category: str
+    # Link to the Category row; None for legacy names that match no category.
+    # Indexed by the (category_id, ...) indexes below
+    category_id: Optional[int] = Field(default=None, foreign_key="category.id")
     discount_price: Optional[float] = None
-    rating: float = 0.0
\ No newline at end of file
+    rating: float = 0.0
+    # Units on sale, net of active reservations. None = stock not tracked (unlimited)
+    stock: Optional[int] = None
+    # Resized/WebP copies of image_url, e.g. {"200w": "/static/images/..._200w.webp"}
+    image_variants: Optional[dict[str, str]] = Field(default=None, sa_column=Column(JSON))
+
+# Effective price = what the customer actually pays (discount_price or price).
+# Declared once so the index expression and the query expression are identical,
+# otherwise SQLite will not use the expression index.
+effective_price = func.coalesce(Product.discount_price, Product.price)
+
+# Composite indexes backing keyset pagination on GET /products/.
+# Every sort key is paired with "id" as a tie-breaker so that (key, id) is unique,
+# and each one has a category-prefixed twin for the filtered listing
+# (ix_product_category_id_id also serves the category_id foreign key and the
+# grouped category counts).
+Index("ix_product_category_id_id", Product.category_id, Product.id)
+Index("ix_product_price_id", Product.price, Product.id)
+Index("ix_product_category_id_price_id", Product.category_id, Product.price, Product.id)
+Index("ix_product_rating_id", Product.rating, Product.id)
+Index("ix_product_category_id_rating_id", Product.category_id, Product.rating, Product.id)
+Index("ix_product_effective_price_id", effective_price, Product.id)
+Index("ix_product_category_id_effective_price_id", Product.category_id, effective_price, Product.id)
+# Brand counts of the category facets (GET /categories/{id}/facets)
+Index("ix_product_category_id_brand", Product.category_id, Product.brand)
+
+# Indexes on the category name that the ones above replaced; dropped from
+# existing databases by create_db_and_tables
+REPLACED_INDEXES = (
+    "ix_product_category_id",
+    "ix_product_category_price_id",
+    "ix_product_category_rating_id",
+    "ix_product_category_effective_price_id",
+)
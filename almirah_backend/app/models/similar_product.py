@@ -0,0 +1,16 @@
+from sqlmodel import Field, SQLModel
+
+class SimilarProduct(SQLModel, table=True):
+    """
+    Precomputed "similar products" neighbour table: the top
+    SIMILAR_PRODUCTS_K products for each product, best first (rank 1).
+    Maintained by SimilarityService; GET /products/{id}/similar is one
+    primary-key range read of it.
+    """
+    # WITHOUT ROWID: rows are stored in primary key order, with no extra rowid index
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    product_id: int = Field(foreign_key="product.id", primary_key=True, ondelete="CASCADE")
+    rank: int = Field(primary_key=True)
+    similar_id: int = Field(foreign_key="product.id", index=True, ondelete="CASCADE")  # Indexed to find lists to repair on delete
+    score: float
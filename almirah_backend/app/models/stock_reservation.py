@@ -0,0 +1,16 @@
+from typing import Optional
+from sqlmodel import Field, SQLModel
+from datetime import datetime
+
+class StockReservation(SQLModel, table=True):
+    """
+    Units of a product held for a user's bag until `expires_at` (checkout window).
+    The units are already taken off Product.stock; releasing the reservation
+    (explicitly or by the expiry sweeper) puts them back.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    product_id: int = Field(foreign_key="product.id", index=True)
+    quantity: int = Field(ge=1)
+    expires_at: datetime = Field(index=True)  # Indexed for the expiry sweeper
+    created_at: datetime = Field(default_factory=datetime.utcnow)
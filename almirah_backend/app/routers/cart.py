@@ -1,146 +1,153 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, Depends, Query
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
 
 from app.core.database import get_session
-from app.models.cart_item import CartItem
-from app.models.product import Product
+from app.core.serialization import dump_rows, dumps, parse_fields, raw_json_response
 from app.schemas.cart_item import (
     CartItemCreate,
     CartItemUpdate,
     CartItemPublic,
-    BagDetailsResponse
+    BagDetailsResponse,
+    BagSummaryResponse,
+    CartBatchRequest
 )
+from app.schemas.stock_reservation import BagReservationResponse
 from app.services.cart_service import CartService
+from app.services.inventory_service import InventoryService
 
 router = APIRouter()
 
 @router.post("/add", response_model=CartItemPublic)
-def add_to_bag(
+async def add_to_bag(
     cart_item_data: CartItemCreate,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """
     Add a product to the user's bag.
-    If the product already exists in the bag, update the quantity.
+    If the product already exists in the bag, update the quantity
+    (atomically, so concurrent adds of the same product all count).
     """
-    # Validate product exists
-    product = session.get(Product, cart_item_data.product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    # Check if item already exists in cart
-    statement = select(CartItem).where(
-        CartItem.user_id == cart_item_data.user_id,
-        CartItem.product_id == cart_item_data.product_id
+    return await CartService.add_item(
+        session,
+        cart_item_data.user_id,
+        cart_item_data.product_id,
+        cart_item_data.quantity
     )
-    existing_item = session.exec(statement).first()
-    
-    if existing_item:
-        # Update quantity
-        existing_item.quantity += cart_item_data.quantity
-        existing_item.updated_at = datetime.utcnow()
-        session.add(existing_item)
-        session.commit()
-        session.refresh(existing_item)
-        return CartService.get_cart_item_with_product(session, existing_item)
-    else:
-        # Create new cart item
-        new_cart_item = CartItem(
-            user_id=cart_item_data.user_id,
-            product_id=cart_item_data.product_id,
-            quantity=cart_item_data.quantity
-        )
-        session.add(new_cart_item)
-        session.commit()
-        session.refresh(new_cart_item)
-        return CartService.get_cart_item_with_product(session, new_cart_item)
+
+@router.post("/batch", response_model=BagDetailsResponse)
+async def apply_bag_batch(
+    batch: CartBatchRequest,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Apply several add/set/remove operations to the user's bag at once
+    (restoring a saved bag, "buy the look", ...), all in one transaction.
+    Returns the recomputed bag.
+    """
+    details = await CartService.apply_batch(session, batch.user_id, batch.operations)
+    return raw_json_response(details.model_dump_json())
 
 @router.delete("/remove/{cart_item_id}")
-def remove_from_bag(
+async def remove_from_bag(
     cart_item_id: int,
     user_id: int,  # Query parameter
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """
     Remove an item from the bag by cart_item_id.
     Requires user_id to ensure user can only remove their own items.
     """
-    cart_item = session.get(CartItem, cart_item_id)
-    if not cart_item:
-        raise HTTPException(status_code=404, detail="Cart item not found")
-    
-    # Verify ownership
-    if cart_item.user_id != user_id:
-        raise HTTPException(
-            status_code=403, 
-            detail="You can only remove your own cart items"
-        )
-    
-    session.delete(cart_item)
-    session.commit()
+    await CartService.remove_item(session, cart_item_id, user_id)
     return {"message": "Item removed from bag successfully"}
 
 @router.put("/update/{cart_item_id}", response_model=CartItemPublic)
-def update_quantity(
+async def update_quantity(
     cart_item_id: int,
     cart_item_update: CartItemUpdate,
     user_id: int,  # Query parameter
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """
     Update the quantity of an item in the bag.
     Requires user_id to ensure user can only update their own items.
     """
-    cart_item = session.get(CartItem, cart_item_id)
-    if not cart_item:
-        raise HTTPException(status_code=404, detail="Cart item not found")
+    cart_item = await CartService.set_item_quantity(session, cart_item_id, user_id, cart_item_update.quantity)
     
-    # Verify ownership
-    if cart_item.user_id != user_id:
-        raise HTTPException(
-            status_code=403,
-            detail="You can only update your own cart items"
-        )
-    
-    # Update quantity
-    cart_item.quantity = cart_item_update.quantity
-    cart_item.updated_at = datetime.utcnow()
-    session.add(cart_item)
-    session.commit()
-    session.refresh(cart_item)
-    
-    return CartService.get_cart_item_with_product(session, cart_item)
+    return await CartService.get_cart_item_with_product(session, cart_item)
+
+# Sparse fieldsets of the bag items (?fields=id,product_name,quantity,item_total)
+ITEM_FIELDS_QUERY = Query(None, description="Comma-separated CartItemPublic fields; id is always included")
 
 @router.get("/details", response_model=BagDetailsResponse)
-def get_bag_details(
+async def get_bag_details(
     user_id: int,  # Query parameter
-    session: Session = Depends(get_session)
+    fields: Optional[str] = ITEM_FIELDS_QUERY,
+    session: AsyncSession = Depends(get_session)
 ):
     """
     Get complete bag details including all items, totals, and calculations.
     Returns empty bag if user has no items.
+    ?fields= trims the items (the totals are always complete).
     """
-    return CartService.get_bag_details(session, user_id)
+    selected = parse_fields(CartItemPublic, fields)
+    if selected is not None:
+        return raw_json_response(dumps(await CartService.get_bag_details_fields(session, user_id, selected)))
+
+    details = await CartService.get_bag_details(session, user_id)
+    # Built by the service from validated data: serialize without re-validating
+    return raw_json_response(details.model_dump_json())
+
+@router.get("/summary", response_model=BagSummaryResponse)
+async def get_bag_summary(
+    user_id: int,  # Query parameter
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Get the bag totals and item count without the items (bag badge, mini-cart).
+    Served from the materialized bag summary: one indexed read.
+    """
+    return await CartService.get_bag_summary(session, user_id)
 
 @router.get("/items", response_model=List[CartItemPublic])
-def get_bag_items(
+async def get_bag_items(
     user_id: int,  # Query parameter
-    session: Session = Depends(get_session)
+    fields: Optional[str] = ITEM_FIELDS_QUERY,
+    session: AsyncSession = Depends(get_session)
 ):
     """
     Get all items in the user's bag.
     Returns empty list if bag is empty.
+    ?fields= returns only the listed fields and only loads their columns.
     """
-    statement = select(CartItem).where(CartItem.user_id == user_id)
-    cart_items = session.exec(statement).all()
-    
-    items_public = []
-    for cart_item in cart_items:
-        items_public.append(
-            CartService.get_cart_item_with_product(session, cart_item)
-        )
-    
-    return items_public
+    selected = parse_fields(CartItemPublic, fields)
+    if selected is not None:
+        items = await CartService.get_cart_item_rows(session, user_id, selected)
+        return raw_json_response(dumps(CartService.project_items(items, selected)))
+
+    items = await CartService.get_cart_items_with_products(session, user_id)
+    return raw_json_response(dump_rows(CartItemPublic, items))
+
+@router.post("/reservation", response_model=BagReservationResponse)
+async def reserve_bag(
+    user_id: int,  # Query parameter
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Hold the stock of every item in the bag for the checkout window
+    (STOCK_RESERVATION_TTL_SECONDS). Replaces any previous reservation.
+    Returns 409 and reserves nothing if an item is out of stock.
+    """
+    return await InventoryService.reserve_bag(session, user_id)
 
+@router.delete("/reservation")
+async def release_bag_reservation(
+    user_id: int,  # Query parameter
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Give the stock held for the bag back (checkout abandoned).
+    Reservations that are not released expire on their own.
+    """
+    released = await InventoryService.release_bag(session, user_id)
+    return {"message": f"Released {released} reserved items"}
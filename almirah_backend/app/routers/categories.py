@@ -1,48 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
-from sqlmodel import Session, select
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, File, UploadFile, Form, Request
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List
-import uuid
-from pathlib import Path
 
-from app.core.database import get_session
+from app.core.database import engine, get_session
 from app.models.category import Category
-from app.schemas.category import CategoryPublic
+from app.schemas.category import CategoryFacets, CategoryPublic, CategoryUpdate, CategoryWithCount
+from app.services.catalog_cache import CacheEntry, cached_response, catalog_cache, json_entry, model_entry
+from app.services.category_service import CategoryService
+from app.services.media_service import MediaService
+from app.services.similarity_service import SimilarityService
 
 router = APIRouter()
 
-# Directory for storing uploaded images
-UPLOAD_DIR = Path("static/images")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-
-def save_uploaded_file(file: UploadFile) -> str:
-    """Save uploaded file and return the URL path"""
-    # Generate unique filename
-    file_extension = Path(file.filename).suffix if file.filename else ".jpg"
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-    
-    # Save file
-    try:
-        with open(file_path, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
-        # Reset file pointer for potential reuse
-        file.file.seek(0)
-    except Exception as e:
-        # Clean up if save fails
-        if file_path.exists():
-            file_path.unlink()
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-    
-    # Return URL path (relative to static mount) - stored as /static/images/... for Flutter compatibility
-    return f"/static/images/{unique_filename}"
+# Products linked to a category move to its similar-products block: recompute
+# that block after the response (blocking: NumPy + sync engine)
+def _refresh_similar_category(category_id: int) -> None:
+    SimilarityService.refresh_category(engine, category_id)
+    catalog_cache.invalidate()
 
 # POST /categories/: To add a category
 @router.post("/", response_model=CategoryPublic)
 async def create_category(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     image: UploadFile = File(...),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """Create a category with file upload"""
     # Validate file type
@@ -50,29 +33,73 @@ async def create_category(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Save the uploaded file
-        image_url = save_uploaded_file(image)
+        # Save the uploaded file (streamed off the event loop), then build
+        # the thumbnails/WebP copies that list views load instead of the original
+        image_url = await MediaService.save_upload(image)
+        image_variants = await MediaService.create_variants(image_url)
         
         # Create category
         db_category = Category(
             name=name,
-            image_url=image_url
+            image_url=image_url,
+            image_variants=image_variants
         )
         
         session.add(db_category)
-        session.commit()
-        session.refresh(db_category)
+        await session.flush()
+        # Products already filed under this name now belong to it
+        linked = await CategoryService.link_products_by_name(session, db_category.id, name)
+        await session.commit()
+        await session.refresh(db_category)
+        catalog_cache.invalidate()
+        if linked:
+            background_tasks.add_task(_refresh_similar_category, db_category.id)
         return db_category
     except HTTPException:
-        # Re-raise HTTP exceptions (like from save_uploaded_file)
+        # Re-raise HTTP exceptions (like from MediaService.save_upload)
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating category: {str(e)}")
 
 # GET /categories/: To fetch the list of all categories
-@router.get("/", response_model=List[CategoryPublic])
-def read_categories(session: Session = Depends(get_session)):
-    """Get all categories"""
-    categories = session.exec(select(Category)).all()
-    return categories
+@router.get("/", response_model=List[CategoryPublic] | List[CategoryWithCount])
+async def read_categories(request: Request, counts: bool = False, session: AsyncSession = Depends(get_session)):
+    """
+    Get all categories (served from the catalog cache when possible).
+    With ?counts=true each category also has its `product_count`.
+    Supports conditional GET: a matching If-None-Match gets 304 Not Modified.
+    """
+    async def build() -> CacheEntry:
+        if counts:
+            return json_entry(CategoryWithCount, await CategoryService.list_with_counts(session))
+        categories = (await session.exec(select(Category))).all()
+        return json_entry(CategoryPublic, categories)
+
+    return await cached_response(request, ("categories", counts), build)
+
+# GET /categories/{category_id}/facets: Brand and price-range counts for filter UIs
+@router.get("/{category_id}/facets", response_model=CategoryFacets)
+async def read_category_facets(category_id: int, request: Request, session: AsyncSession = Depends(get_session)):
+    """
+    Number of products per brand and per price range in a category.
+    Cached like the catalog; supports conditional GET.
+    """
+    async def build() -> CacheEntry:
+        return model_entry(await CategoryService.get_facets(session, category_id))
+
+    return await cached_response(request, ("facets", category_id), build)
+
+# PATCH /categories/{category_id}: Rename a category (its products follow)
+@router.patch("/{category_id}", response_model=CategoryPublic)
+async def update_category(
+    category_id: int,
+    category_update: CategoryUpdate,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_session)
+):
+    category, linked = await CategoryService.rename(session, category_id, category_update.name)
+    catalog_cache.invalidate()
+    if linked:
+        background_tasks.add_task(_refresh_similar_category, category_id)
+    return category
 
@@ -0,0 +1,107 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import config
+from app.core.database import async_engine, get_session
+from app.schemas.change_event import ChangeFeedPosition
+from app.services.change_feed_service import CATALOG_ENTITIES, ChangeFeedService, change_broadcaster, encode_event
+
+router = APIRouter()
+
+# Events read per query while replaying the backlog of a (re)connecting client
+REPLAY_PAGE_SIZE = 500
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop nginx from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def _sse(event: str, data: str) -> bytes:
+    return f"event: {event}\ndata: {data}\n\n".encode()
+
+
+async def _event_stream(since: Optional[int], user_id: Optional[int]) -> AsyncIterator[bytes]:
+    """
+    Replay the events after `since` from the database, then follow the
+    broadcaster. Subscribing first and skipping seqs already sent means no
+    event is lost or repeated between the replay and the live part.
+    """
+    queue = change_broadcaster.subscribe()
+    try:
+        last_seq = -1
+        if since is not None:
+            # A session of its own: the stream outlives the request's dependencies
+            async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                if not await ChangeFeedService.covers(session, since):
+                    last_seq = await ChangeFeedService.latest_seq(session)
+                    # The client missed pruned events: it must reload everything
+                    yield _sse("reset", f'{{"seq": {last_seq}}}')
+                else:
+                    last_seq = since
+                    while True:
+                        events = await ChangeFeedService.read_events(session, last_seq, REPLAY_PAGE_SIZE, user_id)
+                        for event in events:
+                            yield encode_event(event).message
+                        if events:
+                            last_seq = events[-1].seq
+                        if len(events) < REPLAY_PAGE_SIZE:
+                            break
+
+        while True:
+            try:
+                batch = await asyncio.wait_for(queue.get(), timeout=config.CHANGE_FEED_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if batch is None:
+                # Dropped (too far behind, or shutting down): the client reconnects
+                # with Last-Event-ID and catches up from the database
+                return
+            for event in batch:
+                if event.seq <= last_seq:
+                    continue
+                if event.entity in CATALOG_ENTITIES or (user_id is not None and event.user_id == user_id):
+                    yield event.message
+                last_seq = event.seq
+    finally:
+        change_broadcaster.unsubscribe(queue)
+
+
+# GET /events?since=<seq>: Server-Sent Events stream of catalog (and bag) changes
+@router.get("")
+async def stream_events(
+    since: Optional[int] = Query(None, ge=0),
+    user_id: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None, ge=0)
+):
+    """
+    Stream change events as SSE ("event: change", "id: <seq>", JSON data with
+    seq, entity, id, action, user_id). Product and category events go to
+    everyone; pass user_id to also get the events of that user's bag.
+    Events after `since` (or the Last-Event-ID header sent by a reconnecting
+    EventSource) are replayed first; without either the stream starts now.
+    An "event: reset" means the client fell behind the retained history and
+    must reload its data.
+    Only available on SQLite (501 otherwise).
+    """
+    ChangeFeedService.ensure_available(async_engine.dialect.name)
+    if since is None:
+        since = last_event_id
+    return StreamingResponse(_event_stream(since, user_id), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+# GET /events/latest: Current position of the change feed
+@router.get("/latest", response_model=ChangeFeedPosition)
+async def read_latest_event(session: AsyncSession = Depends(get_session)):
+    """
+    Seq of the newest event. To start a local mirror: read this, load the
+    full lists, then follow /events?since=<seq> or poll /products/changes?since=<seq>.
+    """
+    ChangeFeedService.ensure_available(session.bind.dialect.name)
+    return ChangeFeedPosition(seq=await ChangeFeedService.latest_seq(session))
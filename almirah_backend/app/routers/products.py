@@ -1,53 +1,65 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
-from sqlmodel import Session, select
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, File, UploadFile, Form, Query, Request, Response
+from starlette.concurrency import run_in_threadpool
+from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import List, Optional
-import uuid
-from pathlib import Path
 
-from app.core.database import get_session
+from app.core import config
+from app.core.database import engine, get_session
+from app.core.serialization import dumps, parse_fields, public_dict, raw_json_response
 from app.models.product import Product
-from app.schemas.product import ProductPublic
+from app.schemas.change_event import ProductChanges
+from app.schemas.product import (
+    ProductBatch,
+    ProductBatchRequest,
+    ProductImportReport,
+    ProductPublic,
+    ProductStock,
+    ProductStockUpdate
+)
+from app.services.product_service import (
+    ProductService,
+    ProductSort,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE
+)
+from app.services.search_service import SearchService
+from app.services.catalog_cache import CacheEntry, body_entry, cached_response, catalog_cache, json_entry
+from app.services.media_service import MediaService
+from app.services.import_service import DEFAULT_BATCH_SIZE, ProductImportService, detect_format
+from app.services.cart_service import CartService
+from app.services.category_service import CategoryService
+from app.services.change_feed_service import ChangeFeedService
+from app.services.inventory_service import InventoryService
+from app.services.similarity_service import SimilarityService
 
 router = APIRouter()
 
-# Directory for storing uploaded images
-UPLOAD_DIR = Path("static/images")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Similar-products index upkeep, run after the response (blocking: NumPy + sync engine)
+def _add_to_similar_index(product_id: int) -> None:
+    SimilarityService.add_product(engine, product_id)
+    catalog_cache.invalidate()
 
-def save_uploaded_file(file: UploadFile) -> str:
-    """Save uploaded file and return the URL path"""
-    # Generate unique filename
-    file_extension = Path(file.filename).suffix if file.filename else ".jpg"
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-    
-    # Save file
-    try:
-        with open(file_path, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
-        # Reset file pointer for potential reuse
-        file.file.seek(0)
-    except Exception as e:
-        # Clean up if save fails
-        if file_path.exists():
-            file_path.unlink()
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-    
-    # Return URL path (relative to static mount) - stored as /static/images/... for Flutter compatibility
-    return f"/static/images/{unique_filename}"
+def _refresh_similar_index(product_ids: list[int]) -> None:
+    SimilarityService.refresh_products(engine, product_ids)
+    catalog_cache.invalidate()
+
+def _rebuild_similar_index() -> None:
+    SimilarityService.build_index(engine)
+    catalog_cache.invalidate()
 
 # 1. CREATE: Add a new product to the database (FormData with file upload - for admin frontend)
 @router.post("/", response_model=ProductPublic)
 async def create_product(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     brand: str = Form(...),
     category: str = Form(...),
     price: float = Form(...),
     description: Optional[str] = Form(None),
     discount_price: Optional[float] = Form(None),
+    stock: Optional[int] = Form(None, ge=0),
     image: UploadFile = File(...),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """Create a product with file upload from admin panel"""
     # Validate file type
@@ -55,27 +67,34 @@ async def create_product(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Save the uploaded file
-        image_url = save_uploaded_file(image)
+        # Save the uploaded file (streamed off the event loop), then build
+        # the thumbnails/WebP copies that list views load instead of the original
+        image_url = await MediaService.save_upload(image)
+        image_variants = await MediaService.create_variants(image_url)
         
-        # Create product
+        # Create product, linked to its category by id
         db_product = Product(
             name=name,
             brand=brand,
             category=category,
+            category_id=await CategoryService.id_by_name(session, category),
             price=price,
             description=description,
             discount_price=discount_price,
             image_url=image_url,
-            rating=0.0
+            image_variants=image_variants,
+            rating=0.0,
+            stock=stock
         )
         
         session.add(db_product)
-        session.commit()
-        session.refresh(db_product)
+        await session.commit()
+        await session.refresh(db_product)
+        catalog_cache.invalidate()
+        background_tasks.add_task(_add_to_similar_index, db_product.id)
         return db_product
     except HTTPException:
-        # Re-raise HTTP exceptions (like from save_uploaded_file)
+        # Re-raise HTTP exceptions (like from MediaService.save_upload)
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating product: {str(e)}")
@@ -83,14 +102,16 @@ async def create_product(
 # 1b. CREATE: Add a new product with file upload (multipart/form-data - for mobile devices)
 @router.post("/upload", response_model=ProductPublic)
 async def create_product_with_file(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     brand: str = Form(...),
     category: str = Form(...),
     price: float = Form(...),
     description: Optional[str] = Form(None),
     discount_price: Optional[float] = Form(None),
+    stock: Optional[int] = Form(None, ge=0),
     image: UploadFile = File(...),
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_session)
 ):
     """Create a product with file upload from mobile devices"""
     # Validate file type
@@ -98,54 +119,254 @@ async def create_product_with_file(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     try:
-        # Save the uploaded file
-        image_url = save_uploaded_file(image)
+        # Save the uploaded file (streamed off the event loop), then build
+        # the thumbnails/WebP copies that list views load instead of the original
+        image_url = await MediaService.save_upload(image)
+        image_variants = await MediaService.create_variants(image_url)
         
-        # Create product
+        # Create product, linked to its category by id
         db_product = Product(
             name=name,
             brand=brand,
             category=category,
+            category_id=await CategoryService.id_by_name(session, category),
             price=price,
             description=description,
             discount_price=discount_price,
             image_url=image_url,
-            rating=0.0
+            image_variants=image_variants,
+            rating=0.0,
+            stock=stock
         )
         
         session.add(db_product)
-        session.commit()
-        session.refresh(db_product)
+        await session.commit()
+        await session.refresh(db_product)
+        catalog_cache.invalidate()
+        background_tasks.add_task(_add_to_similar_index, db_product.id)
         return db_product
     except HTTPException:
-        # Re-raise HTTP exceptions (like from save_uploaded_file)
+        # Re-raise HTTP exceptions (like from MediaService.save_upload)
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating product: {str(e)}")
 
-# 2. READ: Get all products (with optional category filter)
+# 1c. BULK IMPORT: Stream many products from an NDJSON or CSV file (admin)
+@router.post("/import", response_model=ProductImportReport)
+async def import_products(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=10000)
+):
+    """
+    Import products from an NDJSON (one ProductCreate object per line) or CSV
+    (header row with ProductCreate field names) file.
+    The format is taken from ?format= or guessed from the file name.
+    Invalid rows are skipped and listed in the report; valid rows are inserted
+    in batches of `batch_size`, one transaction per batch. The similar-products
+    index is rebuilt after the response.
+    """
+    file_format = file_format or detect_format(file.filename, file.content_type)
+    if file_format is None:
+        raise HTTPException(status_code=400, detail="Unknown file format, pass ?format=ndjson or ?format=csv")
+
+    # Parsing and batched inserts are blocking work, so they run in a worker thread
+    report = await run_in_threadpool(
+        ProductImportService.import_file, engine, file.file, file_format, batch_size
+    )
+    if report.inserted:
+        catalog_cache.invalidate()
+        background_tasks.add_task(_rebuild_similar_index)
+    return report
+
+# 2. READ: Get a page of products (keyset pagination, sorting and filters)
 @router.get("/", response_model=List[ProductPublic])
-def read_products(
+async def read_products(
+    request: Request,
     category: Optional[str] = None,
-    session: Session = Depends(get_session)
+    category_id: Optional[int] = None,
+    brand: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    discounted: bool = False,
+    sort: ProductSort = ProductSort.ID,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated ProductPublic fields, e.g. id,name,price,image_url"),
+    session: AsyncSession = Depends(get_session)
 ):
-    """Get all products, optionally filtered by category name"""
-    if category:
-        # Filter products by category name
-        products = session.exec(
-            select(Product).where(Product.category == category)
-        ).all()
-    else:
-        # Return all products if no category filter
-        products = session.exec(select(Product)).all()
-    return products
+    """
+    Get products, optionally filtered and sorted.
+    Without ?limit= and ?cursor= every matching product is returned (as
+    before pagination existed). With ?limit= (or a ?cursor=, default page
+    size DEFAULT_PAGE_SIZE) one page is returned; the body stays a plain
+    list and the cursor for the next page comes in the X-Next-Cursor header
+    (pass it back as ?cursor=).
+    min_price/max_price filter on the effective price (discount_price or price).
+    Filter by category with ?category=<name> or ?category_id=<id>.
+    ?fields= returns only the listed fields (id is always included) and only
+    loads those columns, e.g. grid tiles without descriptions.
+    Supports conditional GET: a matching If-None-Match gets 304 Not Modified.
+    """
+    selected = parse_fields(ProductPublic, fields)
+    if limit is None and cursor:
+        limit = DEFAULT_PAGE_SIZE
+
+    async def build() -> CacheEntry:
+        products, next_cursor = await ProductService.list_products(
+            session,
+            limit=limit,
+            cursor=cursor,
+            sort=sort,
+            category=category,
+            category_id=category_id,
+            brand=brand,
+            min_price=min_price,
+            max_price=max_price,
+            discounted=discounted,
+            fields=selected,
+        )
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        return json_entry(ProductPublic, products, headers, fields=selected)
+
+    key = ("products", category, category_id, brand, min_price, max_price, discounted, sort.value, limit, cursor, selected)
+    return await cached_response(request, key, build)
+
+# 2b. SEARCH: Full-text search over name, brand, description and category
+@router.get("/search", response_model=List[ProductPublic])
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Search products, best match first (BM25 ranking).
+    The last word is matched as a prefix, so partial input works for type-ahead.
+    """
+    async def build() -> CacheEntry:
+        products = await SearchService.search_products(session, q, limit=limit, offset=offset)
+        return json_entry(ProductPublic, products)
+
+    return await cached_response(request, ("search", q, limit, offset), build)
+
+async def _product_batch_response(request: Request, session: AsyncSession, ids: list[int]) -> Response:
+    """Cached {"products", "missing"} response for deduplicated `ids`."""
+    async def build() -> CacheEntry:
+        products, missing = await ProductService.get_products(session, ids)
+        return body_entry(dumps({
+            "products": [public_dict(ProductPublic, product) for product in products],
+            "missing": missing,
+        }))
+
+    return await cached_response(request, ("batch", tuple(ids)), build)
+
+# 2c. BATCH READ: Several products by id (wishlist, recently viewed, ...)
+@router.get("/batch", response_model=ProductBatch)
+async def read_product_batch(
+    request: Request,
+    ids: List[str] = Query(..., description="Comma-separated product ids, e.g. ?ids=3,1,2"),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Get up to MAX_BATCH_IDS (200) products by id with one query.
+    Products come back in the requested order (repeated ids once); ids with
+    no product are listed in `missing`. Supports conditional GET.
+    """
+    return await _product_batch_response(request, session, ProductService.parse_ids(ids))
+
+# 2d. BATCH READ: Same as above with the ids in a JSON body (long id lists)
+@router.post("/batch", response_model=ProductBatch)
+async def read_product_batch_post(
+    request: Request,
+    batch_request: ProductBatchRequest,
+    session: AsyncSession = Depends(get_session)
+):
+    return await _product_batch_response(request, session, ProductService.unique_ids(batch_request.ids))
+
+# 2e. CHANGES: Products created, updated or deleted since a change feed position
+@router.get("/changes", response_model=ProductChanges)
+async def read_product_changes(
+    since: int = Query(..., ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Incremental resync of a local product mirror: the current state of every
+    product changed after `since` and the ids of deleted ones, read from the
+    change feed (at most `limit` events per call; `has_more` asks for another).
+    Start from GET /events/latest; 410 Gone when the feed no longer goes back
+    to `since` (reload the full list).
+    """
+    return raw_json_response(await ChangeFeedService.product_changes(session, since, limit))
+
+# 2f. READ ONE: A single product (deep links, product page)
+@router.get("/{product_id}", response_model=ProductPublic)
+async def read_product(product_id: int, request: Request, session: AsyncSession = Depends(get_session)):
+    """Get one product by id. Supports conditional GET."""
+    async def build() -> CacheEntry:
+        product = await session.get(Product, product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return body_entry(dumps(public_dict(ProductPublic, product)))
+
+    return await cached_response(request, ("product", product_id), build)
+
+# 2g. SIMILAR: Products like this one (product page "you may also like")
+@router.get("/{product_id}/similar", response_model=List[ProductPublic])
+async def read_similar_products(
+    product_id: int,
+    request: Request,
+    limit: int = Query(config.SIMILAR_PRODUCTS_K, ge=1, le=config.SIMILAR_PRODUCTS_K),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Up to `limit` products from the same category, most similar first (name
+    and description wording, brand, price). Read from the precomputed
+    similar-products index. Supports conditional GET.
+    """
+    async def build() -> CacheEntry:
+        products = await SimilarityService.get_similar(session, product_id, limit)
+        if not products and await session.get(Product, product_id) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return json_entry(ProductPublic, products)
+
+    return await cached_response(request, ("similar", product_id, limit), build)
+
+# 2h. STOCK: Units on sale and units reserved for a product
+@router.get("/{product_id}/stock", response_model=ProductStock)
+async def get_product_stock(product_id: int, session: AsyncSession = Depends(get_session)):
+    return await InventoryService.get_stock(session, product_id)
+
+# 2i. STOCK: Set the units on sale (restock / stock count, admin); null stops tracking
+@router.put("/{product_id}/stock", response_model=ProductStock)
+async def set_product_stock(
+    product_id: int,
+    stock_update: ProductStockUpdate,
+    session: AsyncSession = Depends(get_session)
+):
+    return await InventoryService.set_stock(session, product_id, stock_update.stock)
 
 # 3. DELETE: Delete a product by ID
 @router.delete("/{product_id}")
-def delete_product(product_id: int, session: Session = Depends(get_session)):
-    product = session.get(Product, product_id)
+async def delete_product(
+    product_id: int,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(get_session)
+):
+    product = await session.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    session.delete(product)
-    session.commit()
+    # Bags holding the product no longer count it in their totals
+    await CartService.invalidate_summaries_for_product(session, product_id)
+    # Its similar-products rows go in the same transaction (they reference it);
+    # the lists it was in are refilled after the response
+    affected = await SimilarityService.detach_product(session, product_id)
+    await session.delete(product)
+    await session.commit()
+    catalog_cache.invalidate()
+    if affected:
+        background_tasks.add_task(_refresh_similar_index, affected)
     return {"message": "Product deleted successfully"}
\ No newline at end of file
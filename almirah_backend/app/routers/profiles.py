@@ -0,0 +1,28 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.core import config
+from app.core.profiling import list_profiles, profile_path, verify_token
+
+router = APIRouter()
+
+def require_profile_token(x_profile: Optional[str] = Header(None)):
+    """Profiles contain SQL and request details: same signed token as X-Profile requests."""
+    if not verify_token(config.PROFILING_SECRET, x_profile):
+        raise HTTPException(status_code=403, detail="Valid X-Profile token required")
+
+@router.get("/", dependencies=[Depends(require_profile_token)])
+async def read_profiles():
+    """Saved request profiles of this process's PROFILING_DIR, newest first"""
+    return await run_in_threadpool(list_profiles)
+
+@router.get("/{filename}", dependencies=[Depends(require_profile_token)])
+def download_profile(filename: str):
+    """Download <id>.prof (cProfile data) or <id>.txt (SQL + top functions report)"""
+    path = profile_path(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=filename)
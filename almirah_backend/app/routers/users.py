@@ -1,19 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from app.core.database import get_session
 from app.models.user import User
 
 router = APIRouter()
 
 @router.post("/create-default", response_model=dict)
-def create_default_user(session: Session = Depends(get_session)):
+async def create_default_user(session: AsyncSession = Depends(get_session)):
     """
     Create a default user for testing.
     Returns the user ID that can be used for cart operations.
     """
     # Check if default user already exists
     statement = select(User).where(User.email == "default@almirah.com")
-    existing_user = session.exec(statement).first()
+    existing_user = (await session.exec(statement)).first()
     
     if existing_user:
         return {
@@ -28,8 +29,8 @@ def create_default_user(session: Session = Depends(get_session)):
         email="default@almirah.com"
     )
     session.add(default_user)
-    session.commit()
-    session.refresh(default_user)
+    await session.commit()
+    await session.refresh(default_user)
     
     return {
         "message": "Default user created successfully",
@@ -38,13 +39,13 @@ def create_default_user(session: Session = Depends(get_session)):
     }
 
 @router.get("/default", response_model=dict)
-def get_default_user(session: Session = Depends(get_session)):
+async def get_default_user(session: AsyncSession = Depends(get_session)):
     """
     Get the default user ID.
     Creates one if it doesn't exist.
     """
     statement = select(User).where(User.email == "default@almirah.com")
-    existing_user = session.exec(statement).first()
+    existing_user = (await session.exec(statement)).first()
     
     if existing_user:
         return {
@@ -58,8 +59,8 @@ def get_default_user(session: Session = Depends(get_session)):
         email="default@almirah.com"
     )
     session.add(default_user)
-    session.commit()
-    session.refresh(default_user)
+    await session.commit()
+    await session.refresh(default_user)
     
     return {
         "user_id": default_user.id,
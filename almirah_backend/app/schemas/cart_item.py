@@ -1,5 +1,5 @@
 from sqlmodel import SQLModel, Field
-from typing import Optional
+from typing import Literal, Optional
 from datetime import datetime
 
 # Base schema for cart item operations
@@ -15,6 +15,17 @@ class CartItemCreate(CartItemBase):
 class CartItemUpdate(SQLModel):
     quantity: int = Field(ge=1)  # Minimum quantity is 1
 
+# Schema for one operation of a batch cart update
+class CartOperation(SQLModel):
+    op: Literal["add", "set", "remove"]  # add to / set / remove the product's quantity
+    product_id: int
+    quantity: int = Field(default=1, ge=1)  # Ignored for "remove"
+
+# Schema for applying several cart operations at once (Client -> Server)
+class CartBatchRequest(SQLModel):
+    user_id: int
+    operations: list[CartOperation] = Field(min_length=1, max_length=200)
+
 # Schema for reading cart item with product details (Server -> Client)
 class CartItemPublic(SQLModel):
     id: int
@@ -41,3 +52,14 @@ class BagDetailsResponse(SQLModel):
     delivery_fee: float = 0.0  # Can be calculated based on business rules
     final_total: float  # total_amount + delivery_fee
 
+
+# Schema for the bag totals without the items (badge / mini-cart)
+class BagSummaryResponse(SQLModel):
+    user_id: int
+    item_count: int  # Number of distinct products in the bag
+    total_quantity: int  # Sum of all quantities
+    total_mrp: float
+    total_discount: float
+    total_amount: float
+    delivery_fee: float = 0.0
+    final_total: float
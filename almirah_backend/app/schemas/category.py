@@ -14,4 +14,30 @@ class CategoryCreate(CategoryBase):
 # We MUST have 'id' here so the frontend knows which category is which.
 class CategoryPublic(CategoryBase):
     id: int
+    # Thumbnail/WebP URLs keyed by variant ("200w", "400w", "800w", "webp")
+    image_variants: dict[str, str] | None = None
 
+# Schema for renaming a category (Client -> Server)
+class CategoryUpdate(SQLModel):
+    name: str
+
+# Schema for reading a category with its number of products (GET /categories/?counts=true)
+class CategoryWithCount(CategoryPublic):
+    product_count: int
+
+# Schemas for the facets of a category (GET /categories/{category_id}/facets)
+class BrandFacet(SQLModel):
+    brand: str
+    count: int
+
+class PriceBucketFacet(SQLModel):
+    # Effective price range: min inclusive, max exclusive (None = no upper bound)
+    min: float
+    max: float | None
+    count: int
+
+class CategoryFacets(SQLModel):
+    category_id: int
+    product_count: int
+    brands: list[BrandFacet]  # Most products first
+    price_buckets: list[PriceBucketFacet]  # Every bucket, empty ones included
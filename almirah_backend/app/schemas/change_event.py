@@ -0,0 +1,22 @@
+from sqlmodel import SQLModel
+
+from app.schemas.product import ProductPublic
+
+# Schema for reading one change feed event (Server -> Client, also the SSE data)
+class ChangeEventPublic(SQLModel):
+    seq: int
+    entity: str  # "product", "category" or "cart"
+    id: int  # Product/category id; for "cart", the product id of the bag line
+    action: str  # "upsert" or "delete"
+    user_id: int | None = None  # Owner of the bag, for "cart" events only
+
+# Schema for the current position of the change feed (GET /events/latest)
+class ChangeFeedPosition(SQLModel):
+    seq: int
+
+# Schema for the product changes since a position (GET /products/changes)
+class ProductChanges(SQLModel):
+    seq: int  # Position reached: pass it back as ?since= for the next call
+    products: list[ProductPublic]  # Created or updated products, current state
+    deleted: list[int]  # Ids of deleted products
+    has_more: bool  # More changes after `seq`: call again right away
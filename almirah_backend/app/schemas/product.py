@@ -1,4 +1,4 @@
-from sqlmodel import SQLModel
+from sqlmodel import Field, SQLModel
 
 # Base schema with shared properties
 class ProductBase(SQLModel):
@@ -13,10 +13,44 @@ class ProductBase(SQLModel):
 # Schema for creating a product (Client -> Server)
 # We don't need 'id' here because the DB creates it.
 class ProductCreate(ProductBase):
-    pass
+    stock: int | None = Field(default=None, ge=0)  # None = not tracked (unlimited)
+
+# Schema for setting the stock of a product (admin restock / stock count)
+class ProductStockUpdate(SQLModel):
+    stock: int | None = Field(ge=0)
+
+# Schema for reading the stock of a product (Server -> Client)
+class ProductStock(SQLModel):
+    product_id: int
+    stock: int | None  # Units still on sale (not in an active reservation)
+    reserved: int  # Units held by active reservations
 
 # Schema for reading a product (Server -> Client)
 # We MUST have 'id' here so the frontend knows which product is which.
 class ProductPublic(ProductBase):
     id: int
-    rating: float = 0.0
\ No newline at end of file
+    category_id: int | None = None  # None = legacy category name with no Category row
+    rating: float = 0.0
+    # Thumbnail/WebP URLs keyed by variant ("200w", "400w", "800w", "webp")
+    image_variants: dict[str, str] | None = None
+
+# Schemas for looking up several products by id (GET/POST /products/batch)
+class ProductBatchRequest(SQLModel):
+    ids: list[int] = Field(min_length=1)
+
+class ProductBatch(SQLModel):
+    products: list[ProductPublic]  # Found products, in the requested order (duplicates dropped)
+    missing: list[int]  # Requested ids with no product, in the requested order
+
+# Schemas for the bulk import report (Server -> Client)
+class ProductImportRowError(SQLModel):
+    row: int  # 1-based line number in the uploaded file (0 = the file as a whole)
+    errors: list[str]
+
+class ProductImportReport(SQLModel):
+    inserted: int = 0
+    failed: int = 0
+    batches: int = 0
+    # Only the first errors are kept (see MAX_REPORTED_ERRORS); `failed` has the full count
+    errors: list[ProductImportRowError] = []
+    errors_truncated: bool = False
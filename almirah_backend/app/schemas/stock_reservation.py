@@ -0,0 +1,13 @@
+from sqlmodel import SQLModel
+from datetime import datetime
+
+# One reserved bag line (Server -> Client)
+class ReservedItem(SQLModel):
+    product_id: int
+    quantity: int
+
+# Schema for the stock held for a user's bag (Server -> Client)
+class BagReservationResponse(SQLModel):
+    user_id: int
+    items: list[ReservedItem]  # Lines with tracked stock; untracked products need no reservation
+    expires_at: datetime | None = None  # None when nothing is reserved
@@ -1,9 +1,63 @@
-from sqlmodel import Session, select
+from datetime import datetime
+from sqlalchemy import delete, exists, func, literal, select as sa_select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import HTTPException
-from typing import List
+from typing import List, NoReturn, Sequence
+from app.core import config
+from app.models.bag_summary import BagSummary
 from app.models.cart_item import CartItem
-from app.models.product import Product
-from app.schemas.cart_item import CartItemPublic, BagDetailsResponse
+from app.models.product import Product, effective_price
+from app.schemas.cart_item import CartItemPublic, BagDetailsResponse, BagSummaryResponse, CartOperation
+from app.services.inventory_service import InventoryService
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {"sqlite": sqlite, "postgresql": postgresql}
+
+# Bag summaries hold totals computed from product prices, so a price change
+# drops the summaries of every bag holding the product (rebuilt on next read).
+# Like the search triggers, this catches any code path that edits prices.
+CREATE_SUMMARY_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS bagsummary_after_product_price_update
+AFTER UPDATE OF price, discount_price ON product BEGIN
+    DELETE FROM bagsummary WHERE user_id IN (SELECT user_id FROM cartitem WHERE product_id = new.id);
+END
+"""
+
+# Same trigger for Postgres, which needs a trigger function
+CREATE_SUMMARY_TRIGGER_POSTGRES = [
+    """
+    CREATE OR REPLACE FUNCTION bagsummary_invalidate_for_product() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM bagsummary WHERE user_id IN (SELECT user_id FROM cartitem WHERE product_id = NEW.id);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS bagsummary_after_product_price_update ON product",
+    """
+    CREATE TRIGGER bagsummary_after_product_price_update
+    AFTER UPDATE OF price, discount_price ON product
+    FOR EACH ROW EXECUTE FUNCTION bagsummary_invalidate_for_product()
+    """,
+]
+
+# Column behind each CartItemPublic field; item_total and item_mrp are
+# computed from the LINE_TOTAL_FIELDS (see get_cart_item_rows)
+CART_ITEM_COLUMNS = {
+    "id": CartItem.id,
+    "product_id": CartItem.product_id,
+    "quantity": CartItem.quantity,
+    "product_name": Product.name,
+    "product_brand": Product.brand,
+    "product_image_url": Product.image_url,
+    "product_price": Product.price,
+    "product_discount_price": Product.discount_price,
+}
+LINE_TOTAL_FIELDS = ("quantity", "product_price", "product_discount_price")
 
 class CartService:
     """Business logic for cart operations."""
@@ -16,27 +70,37 @@ class CartService:
         - item_total: The actual price to pay (discount_price if available, else price)
         - item_mrp: The original MRP (price if no discount, else discount_price is the discounted price)
         """
+        return CartService.line_totals(product.price, product.discount_price, quantity)
+
+    @staticmethod
+    def line_totals(price: float, discount_price: float | None, quantity: int) -> tuple[float, float]:
+        """(item_total, item_mrp) of a bag line from its product's prices."""
         # If discount_price exists, it's the discounted price, and price is the MRP
-        if product.discount_price is not None:
-            item_total = product.discount_price * quantity
-            item_mrp = product.price * quantity
+        if discount_price is not None:
+            item_total = discount_price * quantity
+            item_mrp = price * quantity
         else:
             # No discount, price is both total and MRP
-            item_total = product.price * quantity
-            item_mrp = product.price * quantity
+            item_total = price * quantity
+            item_mrp = price * quantity
         
         return (item_total, item_mrp)
+
+    @staticmethod
+    def bag_totals(total_mrp: float, total_amount: float) -> dict:
+        """Summary fields shared by the bag details and summary responses."""
+        delivery_fee = 0.0  # Free delivery for now
+        return {
+            "total_mrp": total_mrp,
+            "total_discount": total_mrp - total_amount,
+            "total_amount": total_amount,
+            "delivery_fee": delivery_fee,
+            "final_total": total_amount + delivery_fee,
+        }
     
     @staticmethod
-    def get_cart_item_with_product(
-        session: Session, 
-        cart_item: CartItem
-    ) -> CartItemPublic:
-        """Convert CartItem to CartItemPublic with product details."""
-        product = session.get(Product, cart_item.product_id)
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
+    def build_cart_item_public(cart_item: CartItem, product: Product) -> CartItemPublic:
+        """Combine an already-loaded CartItem and its Product into CartItemPublic."""
         item_total, item_mrp = CartService.calculate_item_total(product, cart_item.quantity)
         
         return CartItemPublic(
@@ -53,45 +117,429 @@ class CartService:
         )
     
     @staticmethod
-    def get_bag_details(session: Session, user_id: int) -> BagDetailsResponse:
-        """Get complete bag details with all calculations."""
-        # Get all cart items for user
-        statement = select(CartItem).where(CartItem.user_id == user_id)
-        cart_items = session.exec(statement).all()
+    async def get_cart_item_with_product(
+        session: AsyncSession, 
+        cart_item: CartItem
+    ) -> CartItemPublic:
+        """Convert CartItem to CartItemPublic with product details."""
+        product = await session.get(Product, cart_item.product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
         
-        if not cart_items:
-            return BagDetailsResponse(
-                user_id=user_id,
-                items=[],
-                total_mrp=0.0,
-                total_discount=0.0,
-                total_amount=0.0,
-                delivery_fee=0.0,
-                final_total=0.0
-            )
+        return CartService.build_cart_item_public(cart_item, product)
+    
+    @staticmethod
+    async def get_cart_items_with_products(session: AsyncSession, user_id: int) -> List[CartItemPublic]:
+        """
+        Load all of a user's cart items together with their products.
+        Uses a single joined query, so the number of queries does not grow
+        with the size of the bag. Items whose product no longer exists are skipped.
+        """
+        statement = (
+            select(CartItem, Product)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.user_id == user_id)
+            .order_by(CartItem.id)
+        )
+        rows = (await session.exec(statement)).all()
         
-        # Convert to public format with product details
-        items_public: List[CartItemPublic] = []
+        return [
+            CartService.build_cart_item_public(cart_item, product)
+            for cart_item, product in rows
+        ]
+    
+    @staticmethod
+    async def get_cart_item_rows(
+        session: AsyncSession,
+        user_id: int,
+        fields: Sequence[str],
+        line_totals: bool = False
+    ) -> list[dict]:
+        """
+        Sparse version of get_cart_items_with_products: selects only the
+        columns behind `fields` (CartItemPublic field names), plus the prices
+        when item_total/item_mrp are wanted or `line_totals` is set.
+        Returns one dict per line, to be trimmed with project_items.
+        """
+        load = set(fields)
+        computed = line_totals or "item_total" in load or "item_mrp" in load
+        if computed:
+            load.update(LINE_TOTAL_FIELDS)
+
+        statement = (
+            sa_select(*(column.label(name) for name, column in CART_ITEM_COLUMNS.items() if name in load))
+            .select_from(CartItem)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.user_id == user_id)
+            .order_by(CartItem.id)
+        )
+        items = []
+        for row in (await session.exec(statement)).all():
+            item = row._asdict()
+            if computed:
+                item["item_total"], item["item_mrp"] = CartService.line_totals(
+                    item["product_price"], item["product_discount_price"], item["quantity"]
+                )
+            items.append(item)
+        return items
+
+    @staticmethod
+    def project_items(items: list[dict], fields: Sequence[str]) -> list[dict]:
+        """Keep only `fields` of each line, in CartItemPublic order."""
+        return [{field: item[field] for field in fields} for item in items]
+
+    @staticmethod
+    async def get_bag_details_fields(session: AsyncSession, user_id: int, fields: Sequence[str]) -> dict:
+        """
+        get_bag_details with sparse items: the totals are still complete, but
+        the items only carry `fields` and only those columns (and the prices)
+        are loaded.
+        """
+        items = await CartService.get_cart_item_rows(session, user_id, fields, line_totals=True)
+        total_mrp = sum((item["item_mrp"] for item in items), 0.0)
+        total_amount = sum((item["item_total"] for item in items), 0.0)
+        return {
+            "user_id": user_id,
+            "items": CartService.project_items(items, fields),
+            **CartService.bag_totals(total_mrp, total_amount),
+        }
+
+    @staticmethod
+    async def get_bag_details(session: AsyncSession, user_id: int) -> BagDetailsResponse:
+        """Get complete bag details with all calculations."""
+        # Get all cart items for user, with their products (one query)
+        items_public = await CartService.get_cart_items_with_products(session, user_id)
+        
+        # Totals in a single pass over the hydrated items
         total_mrp = 0.0
         total_amount = 0.0
-        
-        for cart_item in cart_items:
-            item_public = CartService.get_cart_item_with_product(session, cart_item)
-            items_public.append(item_public)
+        for item_public in items_public:
             total_mrp += item_public.item_mrp
             total_amount += item_public.item_total
         
-        total_discount = total_mrp - total_amount
-        delivery_fee = 0.0  # Free delivery for now
-        final_total = total_amount + delivery_fee
-        
         return BagDetailsResponse(
             user_id=user_id,
             items=items_public,
-            total_mrp=total_mrp,
-            total_discount=total_discount,
-            total_amount=total_amount,
-            delivery_fee=delivery_fee,
-            final_total=final_total
+            **CartService.bag_totals(total_mrp, total_amount)
+        )
+
+    @staticmethod
+    def upsert_statement(dialect_name: str, increment: bool):
+        """
+        INSERT ... ON CONFLICT (user_id, product_id) DO UPDATE for cart lines.
+        increment=True adds the new quantity to an existing line ("add"),
+        increment=False replaces it ("set"). Relies on ux_cartitem_user_id_product_id.
+        """
+        dialect = UPSERT_DIALECTS.get(dialect_name)
+        if dialect is None:
+            raise HTTPException(status_code=500, detail=f"Cart upserts are not supported on {dialect_name}")
+
+        statement = dialect.insert(CartItem)
+        quantity = statement.excluded.quantity
+        if increment:
+            quantity = CartItem.quantity + quantity
+        return statement.on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id],
+            set_={"quantity": quantity, "updated_at": statement.excluded.updated_at}
+        )
+    
+    @staticmethod
+    async def add_item(session: AsyncSession, user_id: int, product_id: int, quantity: int) -> CartItemPublic:
+        """
+        Add `quantity` of a product to the bag with a single atomic upsert:
+        the increment happens in SQL (quantity = quantity + :n), so concurrent
+        adds for the same line are never lost and never create a second row.
+        Rejected with 409 if the line would exceed the product's stock.
+        The upsert is the transaction's first statement: on SQLite a deferred
+        transaction that reads before writing cannot wait for the write lock,
+        while a first write waits up to the busy timeout. If even that runs
+        out under heavy contention, the whole transaction is retried (nothing
+        was written) up to SQLITE_LOCKED_RETRIES times.
+        """
+        for attempt in range(config.SQLITE_LOCKED_RETRIES + 1):
+            try:
+                return await CartService._add_item_once(session, user_id, product_id, quantity)
+            except OperationalError as error:
+                await session.rollback()
+                if "database is locked" not in str(error.orig) or attempt == config.SQLITE_LOCKED_RETRIES:
+                    raise
+
+    @staticmethod
+    async def _add_item_once(session: AsyncSession, user_id: int, product_id: int, quantity: int) -> CartItemPublic:
+        now = datetime.utcnow()
+        statement = (
+            CartService.upsert_statement(session.bind.dialect.name, increment=True)
+            .values(user_id=user_id, product_id=product_id, quantity=quantity, created_at=now, updated_at=now)
+            .returning(*CartItem.__table__.columns)
+        )
+        row = (await session.exec(statement)).one()
+        product = await session.get(Product, product_id)
+        if not product:
+            await session.rollback()
+            raise HTTPException(status_code=404, detail="Product not found")
+        await InventoryService.check_bag_stock(session, user_id, [product_id])
+        # The returned quantity equals the added one only if the line is new
+        summarized = await CartService.adjust_summary(
+            session, user_id, product_id, quantity, line_delta=1 if row.quantity == quantity else 0
+        )
+        if not summarized:
+            await CartService.materialize_summary(session, user_id)
+        await session.commit()
+        return CartService.build_cart_item_public(CartItem.model_validate(row._mapping), product)
+    
+    @staticmethod
+    def fold_operations(operations: List[CartOperation]) -> dict[int, tuple[str, int]]:
+        """
+        Reduce an ordered list of operations to one net action per product:
+        ("add", n), ("set", n) or ("remove", 0). E.g. remove then add 2 -> set 2.
+        """
+        actions: dict[int, tuple[str, int]] = {}
+        for operation in operations:
+            previous = actions.get(operation.product_id)
+            if operation.op == "remove":
+                actions[operation.product_id] = ("remove", 0)
+            elif operation.op == "set" or previous is None:
+                actions[operation.product_id] = (operation.op, operation.quantity)
+            elif previous[0] == "remove":
+                actions[operation.product_id] = ("set", operation.quantity)
+            else:
+                # add after add/set keeps the earlier kind and sums the quantities
+                actions[operation.product_id] = (previous[0], previous[1] + operation.quantity)
+        return actions
+    
+    @staticmethod
+    async def apply_batch(
+        session: AsyncSession,
+        user_id: int,
+        operations: List[CartOperation]
+    ) -> BagDetailsResponse:
+        """
+        Apply add/set/remove operations to a bag in a single transaction.
+        Operations are folded per product, then written with at most one
+        upsert per kind plus one delete, whatever the number of operations.
+        Fails as a whole (nothing written) if a product does not exist
+        or does not have enough stock.
+        """
+        actions = CartService.fold_operations(operations)
+        product_ids = [product_id for product_id, (kind, _) in actions.items() if kind != "remove"]
+        
+        # Writes come first so that the transaction waits for SQLite's write
+        # lock instead of failing with "database is locked" (see add_item)
+        now = datetime.utcnow()
+        dialect_name = session.bind.dialect.name
+        for kind in ("add", "set"):
+            rows = [
+                {"user_id": user_id, "product_id": product_id, "quantity": quantity,
+                 "created_at": now, "updated_at": now}
+                for product_id, (action, quantity) in actions.items() if action == kind
+            ]
+            if rows:
+                await session.exec(CartService.upsert_statement(dialect_name, increment=kind == "add"), params=rows)
+        
+        removed = [product_id for product_id, (kind, _) in actions.items() if kind == "remove"]
+        if removed:
+            await session.exec(
+                delete(CartItem).where(CartItem.user_id == user_id, CartItem.product_id.in_(removed))
+            )
+        
+        # Validate all products with one query
+        if product_ids:
+            found = set((await session.exec(select(Product.id).where(Product.id.in_(product_ids)))).all())
+            missing = sorted(set(product_ids) - found)
+            if missing:
+                await session.rollback()
+                raise HTTPException(status_code=404, detail=f"Products not found: {missing}")
+        
+        await InventoryService.check_bag_stock(session, user_id, product_ids)
+        await session.exec(CartService.summary_upsert(dialect_name, user_id, overwrite=True))
+        await session.commit()
+        return await CartService.get_bag_details(session, user_id)
+
+    @staticmethod
+    def create_summary_trigger(connection: Connection) -> None:
+        """
+        Create the trigger invalidating bag summaries on price changes.
+        Prices are only changed outside the API (admin SQL, imports of
+        existing rows), so the trigger is what keeps stored totals right.
+        Bag summaries only exist on SQLite and Postgres (see summary_upsert).
+        """
+        if connection.dialect.name == "sqlite":
+            connection.execute(text(CREATE_SUMMARY_TRIGGER))
+        elif connection.dialect.name == "postgresql":
+            for statement in CREATE_SUMMARY_TRIGGER_POSTGRES:
+                connection.execute(text(statement))
+    
+    @staticmethod
+    def summary_totals(user_id: int):
+        """
+        SELECT of the user's bag totals, in the column order of BagSummary.
+        Lines whose product was deleted are left out, like in get_bag_details.
+        """
+        return (
+            sa_select(
+                literal(user_id).label("user_id"),
+                func.count(CartItem.id).label("item_count"),
+                func.coalesce(func.sum(CartItem.quantity), 0).label("total_quantity"),
+                func.coalesce(func.sum(Product.price * CartItem.quantity), 0.0).label("total_mrp"),
+                func.coalesce(func.sum(effective_price * CartItem.quantity), 0.0).label("total_amount"),
+                literal(datetime.utcnow(), BagSummary.__table__.c.updated_at.type).label("updated_at"),
+            )
+            .select_from(CartItem)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.user_id == user_id)
         )
 
+    @staticmethod
+    def summary_upsert(dialect_name: str, user_id: int, overwrite: bool):
+        """
+        INSERT INTO bagsummary SELECT <totals of the user's bag>, as one statement
+        so the totals cannot miss a concurrent write. overwrite=False keeps an
+        existing summary (see materialize_summary), overwrite=True replaces it.
+        """
+        dialect = UPSERT_DIALECTS.get(dialect_name)
+        if dialect is None:
+            raise HTTPException(status_code=500, detail=f"Bag summaries are not supported on {dialect_name}")
+
+        columns = ["user_id", "item_count", "total_quantity", "total_mrp", "total_amount", "updated_at"]
+        statement = dialect.insert(BagSummary).from_select(columns, CartService.summary_totals(user_id))
+        if not overwrite:
+            return statement.on_conflict_do_nothing(index_elements=[BagSummary.user_id])
+        return statement.on_conflict_do_update(
+            index_elements=[BagSummary.user_id],
+            set_={column: statement.excluded[column] for column in columns[1:]}
+        )
+    
+    @staticmethod
+    async def adjust_summary(
+        session: AsyncSession,
+        user_id: int,
+        product_id: int,
+        quantity_delta: int,
+        line_delta: int = 0
+    ) -> bool:
+        """
+        Apply the change of one bag line to the user's BagSummary, in SQL and
+        relative to the stored values (safe under concurrent writes).
+        No-op if the summary is not materialized or the product no longer exists.
+        Call inside the transaction that changes the CartItem.
+        Returns whether a summary was updated (if not, see materialize_summary).
+        """
+        price = sa_select(Product.price).where(Product.id == product_id).scalar_subquery()
+        amount = sa_select(effective_price).where(Product.id == product_id).scalar_subquery()
+        result = await session.exec(
+            update(BagSummary)
+            .where(BagSummary.user_id == user_id, exists().where(Product.id == product_id))
+            .values(
+                item_count=BagSummary.item_count + line_delta,
+                total_quantity=BagSummary.total_quantity + quantity_delta,
+                total_mrp=BagSummary.total_mrp + price * quantity_delta,
+                total_amount=BagSummary.total_amount + amount * quantity_delta,
+                updated_at=datetime.utcnow()
+            )
+        )
+        return result.rowcount > 0
+
+    @staticmethod
+    async def materialize_summary(session: AsyncSession, user_id: int) -> None:
+        """
+        Store the user's bag totals if there is no summary yet (first write
+        to the bag, or after a price change dropped it). Call inside a bag
+        write transaction after its writes: it already holds the write lock,
+        so reads of the summary never have to write.
+        """
+        dialect_name = session.bind.dialect.name
+        if dialect_name in UPSERT_DIALECTS:
+            await session.exec(CartService.summary_upsert(dialect_name, user_id, overwrite=False))
+    
+    @staticmethod
+    async def _owned_item_or_error(session: AsyncSession, cart_item_id: int, user_id: int, action: str) -> NoReturn:
+        """Raise 404 if the cart item does not exist, else 403 (it belongs to another user)."""
+        await session.rollback()
+        if await session.get(CartItem, cart_item_id) is None:
+            raise HTTPException(status_code=404, detail="Cart item not found")
+        raise HTTPException(status_code=403, detail=f"You can only {action} your own cart items")
+
+    @staticmethod
+    async def set_item_quantity(session: AsyncSession, cart_item_id: int, user_id: int, quantity: int) -> CartItem:
+        """
+        Set the quantity of one of the user's bag lines and move the summary
+        by the difference. The line is written before its old quantity is
+        read, which holds the write lock (SQLite) or the row lock (Postgres):
+        a concurrent update of the line cannot slip in between and leave the
+        summary off.
+        """
+        now = datetime.utcnow()
+        locked = await session.exec(
+            update(CartItem)
+            .where(CartItem.id == cart_item_id, CartItem.user_id == user_id)
+            .values(updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        if locked.rowcount == 0:
+            await CartService._owned_item_or_error(session, cart_item_id, user_id, "update")
+
+        cart_item = (await session.exec(
+            select(CartItem).where(CartItem.id == cart_item_id).execution_options(populate_existing=True)
+        )).one()
+        summarized = await CartService.adjust_summary(
+            session, user_id, cart_item.product_id, quantity - cart_item.quantity
+        )
+        cart_item.quantity = quantity
+        session.add(cart_item)
+        await InventoryService.check_bag_stock(session, user_id, [cart_item.product_id])
+        if not summarized:
+            # Autoflush writes the new quantity before the totals are taken
+            await CartService.materialize_summary(session, user_id)
+        await session.commit()
+        await session.refresh(cart_item)
+        return cart_item
+
+    @staticmethod
+    async def remove_item(session: AsyncSession, cart_item_id: int, user_id: int) -> None:
+        """
+        Delete one of the user's bag lines; the summary is adjusted by the
+        quantity the DELETE itself returns, so it matches what was removed.
+        """
+        row = (await session.exec(
+            delete(CartItem)
+            .where(CartItem.id == cart_item_id, CartItem.user_id == user_id)
+            .returning(CartItem.product_id, CartItem.quantity)
+            .execution_options(synchronize_session=False)
+        )).first()
+        if row is None:
+            await CartService._owned_item_or_error(session, cart_item_id, user_id, "remove")
+
+        summarized = await CartService.adjust_summary(
+            session, user_id, row.product_id, -row.quantity, line_delta=-1
+        )
+        if not summarized:
+            await CartService.materialize_summary(session, user_id)
+        await session.commit()
+
+    @staticmethod
+    async def invalidate_summaries_for_product(session: AsyncSession, product_id: int) -> None:
+        """Drop the summaries of every bag holding `product_id` (e.g. before deleting it)."""
+        await session.exec(
+            delete(BagSummary).where(
+                BagSummary.user_id.in_(select(CartItem.user_id).where(CartItem.product_id == product_id))
+            )
+        )
+    
+    @staticmethod
+    async def get_bag_summary(session: AsyncSession, user_id: int) -> BagSummaryResponse:
+        """
+        Bag totals without the items: one primary-key read of BagSummary.
+        Read-only: without a stored summary (bag not written since, or a price
+        change dropped it) the totals are aggregated from the cart; the next
+        write to the bag stores them (see materialize_summary).
+        """
+        summary = await session.get(BagSummary, user_id)
+        if summary is None:
+            summary = (await session.exec(CartService.summary_totals(user_id))).one()
+        
+        return BagSummaryResponse(
+            user_id=user_id,
+            item_count=summary.item_count,
+            total_quantity=summary.total_quantity,
+            **CartService.bag_totals(summary.total_mrp, summary.total_amount)
+        )
@@ -0,0 +1,232 @@
+import asyncio
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Iterable, NamedTuple, Optional, Sequence
+
+from fastapi import Request, Response
+
+from app.core import config
+from app.core.http_cache import conditional_json_response, make_etag, not_modified_response
+from app.core.serialization import dump_rows
+
+
+class CacheEntry(NamedTuple):
+    """
+    A pre-serialized response: JSON body bytes, extra response headers and its
+    ETag (set by CatalogCache.get_or_build, see CatalogCache.etag).
+    `encoded` memoizes the compressed body per content coding ("br", "gzip");
+    those copies are a fraction of the body and not counted against CATALOG_CACHE_MAX_BYTES.
+    """
+    body: bytes
+    headers: dict[str, str]
+    etag: str
+    encoded: dict[str, bytes]
+
+
+def body_entry(body: bytes, headers: Optional[dict] = None) -> CacheEntry:
+    """CacheEntry for an already-encoded JSON body."""
+    return CacheEntry(body=body, headers=headers or {}, etag="", encoded={})
+
+
+def json_entry(
+    schema: type,
+    rows: Iterable[Any],
+    headers: Optional[dict] = None,
+    fields: Optional[Sequence[str]] = None
+) -> CacheEntry:
+    """
+    Serialize DB rows as a list of a public schema (e.g. ProductPublic) into
+    a CacheEntry, keeping only `fields` when given.
+    """
+    return body_entry(dump_rows(schema, rows, fields), headers)
+
+
+def model_entry(model: Any, headers: Optional[dict] = None) -> CacheEntry:
+    """Serialize a single response model (e.g. CategoryFacets) into a CacheEntry."""
+    return body_entry(model.model_dump_json().encode(), headers)
+
+
+class CatalogCache:
+    """
+    In-process LRU cache of serialized catalog responses.
+    Bounded by both entry count and total body size; entries expire after
+    `ttl` seconds. Every catalog write calls invalidate(), which bumps the
+    version and drops all entries (for writes by other processes, the
+    change feed poller does; see ChangeBroadcaster.poll).
+    Reads remember the version they started at, so a slow read that
+    overlaps a write cannot put stale data back into the cache.
+
+    With `coalesce`, concurrent misses on the same key are single-flighted:
+    the first request builds the entry (one query, one serialization) and
+    the others wait for its result instead of running the same query.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, coalesce: bool = True, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.coalesce = coalesce
+        self.version = 0
+        # Versions restart at 0 in every process: ETags carry this instance
+        # so another worker (or a restart) cannot match them by accident
+        self.instance = secrets.token_hex(8)
+        # key -> (entry, monotonic time it expires at)
+        self._entries: OrderedDict[Hashable, tuple[CacheEntry, float]] = OrderedDict()
+        self._size = 0
+        # Guards the shared state (maintenance code and benchmarks use threads)
+        self._lock = threading.Lock()
+        # (key, version) -> result of the build in progress, on the event loop that runs it
+        self._inflight: dict[tuple[Hashable, int], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def etag(self, key: Hashable, version: Optional[int] = None) -> str:
+        """
+        ETag of the response for `key` at catalog `version` (default: the
+        current one), known without building it. Every write bumps the
+        version; the TTL period is part of the tag too, so content changed by
+        writes this process is not told about (no change feed) gets a new tag
+        as soon as the cache would rebuild it.
+        """
+        period = int(time.monotonic() // self.ttl) if self.ttl else 0
+        return make_etag(self.instance, self.version if version is None else version, period, key)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        with self._lock:
+            stored = self._entries.get(key)
+            if stored is not None and stored[1] <= time.monotonic():
+                del self._entries[key]
+                self._size -= len(stored[0].body)
+                stored = None
+            if stored is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return stored[0]
+
+    def set(self, key: Hashable, entry: CacheEntry, version: int) -> None:
+        """Store `entry` unless the catalog changed since `version` was read."""
+        size = len(entry.body)
+        with self._lock:
+            if version != self.version or size > self.max_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[0].body)
+            expires_at = time.monotonic() + self.ttl if self.ttl else float("inf")
+            self._entries[key] = (entry, expires_at)
+            self._size += size
+            # Evict least recently used entries until back within bounds
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                self.evictions += 1
+
+    async def get_or_build(
+        self,
+        key: Hashable,
+        build: Callable[[], Awaitable[CacheEntry]]
+    ) -> CacheEntry:
+        """
+        Return the cached entry for `key`, building and storing it on a miss
+        (with the ETag of the version the build started at).
+        A build already running for `key` (same catalog version, same event
+        loop) is joined rather than repeated; its result, or its error (e.g.
+        a 404), is shared with every waiter.
+        """
+        while True:
+            entry = self.get(key)
+            if entry is not None:
+                return entry
+            version = self.version
+            etag = self.etag(key, version)
+            if not self.coalesce:
+                entry = (await build())._replace(etag=etag)
+                self.set(key, entry, version)
+                return entry
+
+            loop = asyncio.get_running_loop()
+            flight_key = (key, version)
+            future = self._inflight.get(flight_key)
+            if future is None or future.get_loop() is not loop:
+                break
+            with self._lock:
+                self.coalesced += 1
+            try:
+                # shield: a waiter that goes away must not cancel the shared build
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # This waiter itself was cancelled
+                # The request running the build was cancelled: retry (and maybe lead)
+
+        future = self._inflight[flight_key] = loop.create_future()
+        try:
+            entry = (await build())._replace(etag=etag)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark the exception as retrieved when nobody was waiting
+                future.exception()
+            raise
+        else:
+            self.set(key, entry, version)
+            future.set_result(entry)
+            return entry
+        finally:
+            self._inflight.pop(flight_key, None)
+
+    def invalidate(self) -> None:
+        """Drop everything; called after any product or category write."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+            }
+
+
+async def cached_response(
+    request: Request,
+    key: Hashable,
+    build: Callable[[], Awaitable[CacheEntry]]
+) -> Response:
+    """
+    Conditional JSON response for a catalog route: 304 straight away when
+    If-None-Match names the current ETag of `key` (no query, no lookup),
+    otherwise the cached or freshly built entry.
+    """
+    not_modified = not_modified_response(request, catalog_cache.etag(key))
+    if not_modified is not None:
+        return not_modified
+    entry = await catalog_cache.get_or_build(key, build)
+    return conditional_json_response(request, entry.body, entry.etag, entry.headers, encoded=entry.encoded)
+
+
+# Shared instance used by the catalog routers
+catalog_cache = CatalogCache(
+    max_entries=config.CATALOG_CACHE_MAX_ENTRIES,
+    max_bytes=config.CATALOG_CACHE_MAX_BYTES,
+    coalesce=config.CATALOG_CACHE_COALESCE,
+    ttl=config.CATALOG_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,139 @@
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import case, func, text, update
+from sqlalchemy.engine import Connection
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import config
+from app.models.category import Category
+from app.models.product import Product, effective_price
+from app.schemas.category import BrandFacet, CategoryFacets, CategoryWithCount, PriceBucketFacet
+
+# Links products to the category of the same name (lowest id if the name is
+# duplicated). Only touches unlinked rows, so it is cheap to run on every startup
+LINK_PRODUCTS = """
+UPDATE product SET category_id = (
+    SELECT MIN(category.id) FROM category WHERE category.name = product.category
+)
+WHERE category_id IS NULL
+"""
+
+
+class CategoryService:
+    """Category lookups, renames and the aggregates shown next to categories."""
+
+    @staticmethod
+    def link_products(connection: Connection) -> None:
+        """Migration for existing almirah.db files: fill Product.category_id from the category name."""
+        connection.execute(text(LINK_PRODUCTS))
+
+    @staticmethod
+    async def link_products_by_name(session: AsyncSession, category_id: int, name: str) -> int:
+        """
+        Link the unlinked products named like a new (or renamed) category to
+        it, so they show up under it without waiting for a restart. Not committed.
+        Returns the number of products linked.
+        """
+        result = await session.exec(
+            update(Product)
+            .where(Product.category_id.is_(None), Product.category == name)
+            .values(category_id=category_id)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    @staticmethod
+    def ids_by_name(connection: Connection, names: Iterable[str]) -> dict[str, int]:
+        """Category id for each of `names` that has a category, in one query (blocking)."""
+        rows = connection.execute(
+            select(Category.name, func.min(Category.id))
+            .where(Category.name.in_(set(names)))
+            .group_by(Category.name)
+        ).all()
+        return {name: category_id for name, category_id in rows}
+
+    @staticmethod
+    async def id_by_name(session: AsyncSession, name: str) -> Optional[int]:
+        """Id of the category called `name`, None if there is none."""
+        return (await session.exec(
+            select(func.min(Category.id)).where(Category.name == name)
+        )).one()
+
+    @staticmethod
+    async def list_with_counts(session: AsyncSession) -> list[CategoryWithCount]:
+        """Every category with its number of products, counted by one grouped query."""
+        rows = (await session.exec(
+            select(Category, func.count(Product.id))
+            .outerjoin(Product, Product.category_id == Category.id)
+            .group_by(Category.id)
+            .order_by(Category.id)
+        )).all()
+        return [
+            CategoryWithCount.model_validate(category, update={"product_count": count})
+            for category, count in rows
+        ]
+
+    @staticmethod
+    async def get_facets(session: AsyncSession, category_id: int) -> CategoryFacets:
+        """
+        Brand and price-range counts of a category's products.
+        Two grouped queries (brands, price buckets); nothing is counted in Python.
+        Price buckets follow PRICE_FACET_EDGES on the effective price.
+        """
+        if await session.get(Category, category_id) is None:
+            raise HTTPException(status_code=404, detail="Category not found")
+
+        brands = (await session.exec(
+            select(Product.brand, func.count().label("count"))
+            .where(Product.category_id == category_id)
+            .group_by(Product.brand)
+            .order_by(func.count().desc(), Product.brand)
+        )).all()
+
+        edges = sorted(config.PRICE_FACET_EDGES)
+        bucket = case(
+            *((effective_price < edge, index) for index, edge in enumerate(edges)),
+            else_=len(edges)
+        ).label("bucket")
+        bucket_counts = dict((await session.exec(
+            select(bucket, func.count())
+            .where(Product.category_id == category_id)
+            .group_by(bucket)
+        )).all())
+
+        bounds = [0.0, *edges, None]
+        return CategoryFacets(
+            category_id=category_id,
+            product_count=sum(bucket_counts.values()),
+            brands=[BrandFacet(brand=brand, count=count) for brand, count in brands],
+            price_buckets=[
+                PriceBucketFacet(min=bounds[index], max=bounds[index + 1], count=bucket_counts.get(index, 0))
+                for index in range(len(edges) + 1)
+            ]
+        )
+
+    @staticmethod
+    async def rename(session: AsyncSession, category_id: int, name: str) -> tuple[Category, int]:
+        """
+        Rename a category. Products follow through category_id; their display
+        name is updated by one set-based UPDATE in the same transaction, and
+        unlinked products already named like the new name are linked.
+        Returns: (category, number of products newly linked)
+        """
+        category = await session.get(Category, category_id)
+        if category is None:
+            raise HTTPException(status_code=404, detail="Category not found")
+
+        category.name = name
+        session.add(category)
+        await session.exec(
+            update(Product)
+            .where(Product.category_id == category_id)
+            .values(category=name)
+            .execution_options(synchronize_session=False)
+        )
+        linked = await CategoryService.link_products_by_name(session, category_id, name)
+        await session.commit()
+        return category, linked
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, or_, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import config
+from app.core.serialization import dumps, public_dict
+from app.models.change_event import ChangeEvent
+from app.models.product import Product
+from app.schemas.product import ProductPublic
+from app.services.catalog_cache import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+# Catalog events go to every client; cart events only to the bag's owner
+CATALOG_ENTITIES = ("product", "category")
+
+# Product columns clients can see: writes to other columns (stock) are not changes
+PRODUCT_PUBLIC_COLUMNS = ", ".join(field for field in ProductPublic.model_fields if field != "id")
+
+
+def _change_triggers() -> dict[str, str]:
+    """Trigger name -> CREATE TRIGGER statement, one per table and write kind."""
+    sources = {
+        # table: (entity, event id column, user id column, UPDATE OF columns)
+        "product": ("product", "id", None, PRODUCT_PUBLIC_COLUMNS),
+        "category": ("category", "id", None, None),
+        "cartitem": ("cart", "product_id", "user_id", "quantity"),
+    }
+    triggers = {}
+    for table, (entity, id_column, user_column, update_columns) in sources.items():
+        for kind, action, row in (("insert", "upsert", "new"), ("update", "upsert", "new"), ("delete", "delete", "old")):
+            user_id = f"{row}.{user_column}" if user_column else "NULL"
+            event = f"UPDATE OF {update_columns}" if kind == "update" and update_columns else kind.upper()
+            name = f"changeevent_after_{table}_{kind}"
+            triggers[name] = f"""
+            CREATE TRIGGER {name} AFTER {event} ON {table} BEGIN
+                INSERT INTO changeevent(entity, entity_id, action, user_id, created_at)
+                VALUES ('{entity}', {row}.{id_column}, '{action}', {user_id}, CURRENT_TIMESTAMP);
+            END
+            """
+    return triggers
+
+
+# A change event encoded once for every SSE client of the process
+EncodedEvent = namedtuple("EncodedEvent", ["seq", "entity", "user_id", "message"])
+
+
+def encode_event(event: ChangeEvent) -> EncodedEvent:
+    """SSE message for an event: "id: <seq>", "event: change" and the JSON data."""
+    data = dumps({
+        "seq": event.seq,
+        "entity": event.entity,
+        "id": event.entity_id,
+        "action": event.action,
+        "user_id": event.user_id,
+    })
+    message = b"id: %d\nevent: change\ndata: %s\n\n" % (event.seq, data)
+    return EncodedEvent(event.seq, event.entity, event.user_id, message)
+
+
+class ChangeFeedService:
+    """
+    Sequenced log of catalog and bag changes.
+    Database triggers append an event for every write to the product,
+    category and cartitem tables, whichever code path performs it (API
+    handlers, imports, manual SQL), in the writing transaction. Clients
+    follow the log over SSE (GET /events) or pull it (GET /products/changes).
+    """
+
+    @staticmethod
+    def create_triggers(connection: Connection) -> None:
+        """
+        (Re)create the triggers writing the change feed. Recreated on every
+        startup so the product trigger follows ProductPublic's columns.
+        SQLite only; on other databases the feed stays empty.
+        """
+        if connection.dialect.name != "sqlite":
+            return
+        for name, statement in _change_triggers().items():
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            connection.execute(text(statement))
+
+    @staticmethod
+    def ensure_available(dialect_name: str) -> None:
+        """
+        Raise 501 where no triggers write the feed (anything but SQLite): an
+        empty feed would otherwise look like "nothing changed" forever.
+        """
+        if dialect_name != "sqlite":
+            raise HTTPException(status_code=501, detail=f"The change feed is not available on {dialect_name}")
+
+    @staticmethod
+    async def latest_seq(session: AsyncSession) -> int:
+        """Seq of the newest event, 0 if there is none."""
+        return (await session.exec(select(func.coalesce(func.max(ChangeEvent.seq), 0)))).one()
+
+    @staticmethod
+    async def covers(session: AsyncSession, since: int) -> bool:
+        """
+        False if events after `since` have been pruned, so a client at `since`
+        cannot catch up from the log and must reload everything.
+        """
+        oldest = (await session.exec(select(func.min(ChangeEvent.seq)))).one()
+        return oldest is None or since >= oldest - 1
+
+    @staticmethod
+    async def read_events(
+        session: AsyncSession,
+        since: int,
+        limit: int,
+        user_id: Optional[int] = None,
+        entities: tuple[str, ...] = CATALOG_ENTITIES
+    ) -> list[ChangeEvent]:
+        """
+        Up to `limit` events after `since`, oldest first: events of `entities`,
+        plus the cart events of `user_id` when given.
+        """
+        visible = ChangeEvent.entity.in_(entities)
+        if user_id is not None:
+            visible = or_(visible, (ChangeEvent.entity == "cart") & (ChangeEvent.user_id == user_id))
+        return list((await session.exec(
+            select(ChangeEvent).where(ChangeEvent.seq > since, visible).order_by(ChangeEvent.seq).limit(limit)
+        )).all())
+
+    @staticmethod
+    async def has_events(session: AsyncSession, since: int, entities: tuple[str, ...]) -> bool:
+        """True if an event of `entities` was written after `since` (one indexed seq range probe)."""
+        return (await session.exec(
+            select(ChangeEvent.seq).where(ChangeEvent.seq > since, ChangeEvent.entity.in_(entities)).limit(1)
+        )).first() is not None
+
+    @staticmethod
+    async def product_changes(session: AsyncSession, since: int, limit: int) -> bytes:
+        """
+        JSON body of ProductChanges: the products changed after `since`, each
+        once in its current state (one IN query), and the deleted ids. Reads at
+        most `limit` events; `has_more` tells the client to call again.
+        Raises 410 if the log no longer covers `since`, 501 if there is no feed.
+        """
+        ChangeFeedService.ensure_available(session.bind.dialect.name)
+        if not await ChangeFeedService.covers(session, since):
+            raise HTTPException(
+                status_code=410,
+                detail="Changes since this seq were pruned, reload the catalog and restart from GET /events/latest"
+            )
+
+        events = await ChangeFeedService.read_events(session, since, limit, entities=("product",))
+        # Last action per product wins (a product can be updated, then deleted)
+        actions = {}
+        for event in events:
+            actions.pop(event.entity_id, None)
+            actions[event.entity_id] = event.action
+
+        changed = [product_id for product_id, action in actions.items() if action == "upsert"]
+        products = (await session.exec(select(Product).where(Product.id.in_(changed)))).all() if changed else []
+        found = {product.id for product in products}
+        deleted = [product_id for product_id, action in actions.items() if action == "delete" or product_id not in found]
+
+        return dumps({
+            "seq": events[-1].seq if events else since,
+            "products": [public_dict(ProductPublic, product) for product in products],
+            "deleted": deleted,
+            "has_more": len(events) == limit,
+        })
+
+    @staticmethod
+    async def prune(session: AsyncSession, retention_seconds: int) -> int:
+        """
+        Delete events older than `retention_seconds`, always keeping the newest
+        one (covers() relies on it). Returns the number deleted.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+        newest = select(func.max(ChangeEvent.seq)).scalar_subquery()
+        result = await session.exec(
+            delete(ChangeEvent)
+            .where(ChangeEvent.created_at < cutoff, ChangeEvent.seq < newest)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def run_pruner(async_engine: AsyncEngine, interval_seconds: float) -> None:
+        """Prune the change feed every `interval_seconds`, until cancelled (app lifespan)."""
+        while True:
+            try:
+                async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                    pruned = await ChangeFeedService.prune(session, config.CHANGE_FEED_RETENTION_SECONDS)
+                if pruned:
+                    logger.info("Pruned %d change feed events", pruned)
+            except Exception:
+                logger.exception("Change feed pruning failed")
+            await asyncio.sleep(interval_seconds)
+
+
+class ChangeBroadcaster:
+    """
+    Fans new change events out to the SSE clients of this process.
+    One task polls the log (an indexed seq > N query) and hands every batch,
+    encoded once, to each subscriber's queue, so the database load does not
+    grow with the number of connected clients. Each process polls on its
+    own, which also picks up writes made by other processes: a catalog
+    event invalidates this process's catalog cache.
+    """
+
+    def __init__(self):
+        self.last_seq = 0
+        self._subscribers: set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Queue receiving lists of EncodedEvent, then None when the subscriber is
+        dropped (too far behind, or shutdown).
+        """
+        queue = asyncio.Queue(maxsize=config.CHANGE_FEED_CLIENT_BUFFER)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    @staticmethod
+    def _close(queue: asyncio.Queue) -> None:
+        # Make room for the end-of-stream marker
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def publish(self, events: list[EncodedEvent]) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(events)
+            except asyncio.QueueFull:
+                self._subscribers.discard(queue)
+                self._close(queue)
+
+    async def poll(self, session: AsyncSession) -> None:
+        """
+        Publish the events written since the last poll. Catalog events drop
+        the catalog cache first, so clients reacting to them read fresh data.
+        """
+        if not self._subscribers:
+            # Nobody listening: just keep up with the log
+            latest = await ChangeFeedService.latest_seq(session)
+            if latest > self.last_seq and await ChangeFeedService.has_events(session, self.last_seq, CATALOG_ENTITIES):
+                catalog_cache.invalidate()
+            self.last_seq = latest
+            return
+        while True:
+            events = (await session.exec(
+                select(ChangeEvent).where(ChangeEvent.seq > self.last_seq).order_by(ChangeEvent.seq).limit(1000)
+            )).all()
+            if not events:
+                return
+            if any(event.entity in CATALOG_ENTITIES for event in events):
+                catalog_cache.invalidate()
+            self.publish([encode_event(event) for event in events])
+            self.last_seq = events[-1].seq
+
+    async def run(self, async_engine: AsyncEngine, interval_seconds: float) -> None:
+        """Poll every `interval_seconds` until cancelled (app lifespan); then end every stream."""
+        try:
+            while True:
+                try:
+                    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                        await self.poll(session)
+                except Exception:
+                    logger.exception("Change feed poll failed")
+                await asyncio.sleep(interval_seconds)
+        finally:
+            for queue in list(self._subscribers):
+                self._close(queue)
+            self._subscribers.clear()
+
+
+# Shared instance: started by the app lifespan, read by GET /events
+change_broadcaster = ChangeBroadcaster()
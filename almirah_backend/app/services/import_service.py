@@ -0,0 +1,141 @@
+import csv
+import io
+import json
+from typing import BinaryIO, Iterator, Optional
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+from app.models.product import Product
+from app.schemas.product import ProductCreate, ProductImportReport, ProductImportRowError
+from app.services.category_service import CategoryService
+
+# Rows inserted per transaction (one executemany per batch)
+DEFAULT_BATCH_SIZE = 1000
+# Per-row errors kept in the report, so a bad million-row file cannot blow up memory
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ("ndjson", "csv")
+
+
+def _iter_ndjson(text: io.TextIOBase) -> Iterator[tuple[int, object]]:
+    """Yield (line_number, parsed JSON or the decode error) for each non-blank line."""
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, e
+
+
+def _iter_csv(text: io.TextIOBase) -> Iterator[tuple[int, object]]:
+    """Yield (row_number, record) for each CSV data row; empty cells become None."""
+    reader = csv.DictReader(text)
+    for record in reader:
+        # reader.line_num counts physical lines, so quoted multi-line cells keep numbering honest
+        yield reader.line_num, {key: (value if value != "" else None) for key, value in record.items()}
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str] = None) -> Optional[str]:
+    """Guess "ndjson" or "csv" from a file name or content type."""
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl", ".json")) or (content_type or "").endswith(("ndjson", "json")):
+        return "ndjson"
+    if name.endswith(".csv") or (content_type or "") == "text/csv":
+        return "csv"
+    return None
+
+
+class ProductImportService:
+    """Bulk product import from NDJSON or CSV, in batched transactions."""
+
+    @staticmethod
+    def _record_error(report: ProductImportReport, row: int, errors: list[str]) -> None:
+        report.failed += 1
+        if len(report.errors) < MAX_REPORTED_ERRORS:
+            report.errors.append(ProductImportRowError(row=row, errors=errors))
+        else:
+            report.errors_truncated = True
+
+    @staticmethod
+    def _insert_batch(engine: Engine, batch: list[tuple[int, dict]], report: ProductImportReport) -> None:
+        """
+        Insert a batch with a single executemany in one transaction.
+        If the database rejects the batch, retry its rows one by one so only
+        the offending rows are reported and the rest still get in.
+        """
+        report.batches += 1
+        try:
+            with engine.begin() as connection:
+                # Link the rows to their categories (one lookup per batch)
+                category_ids = CategoryService.ids_by_name(connection, (values["category"] for _, values in batch))
+                for _, values in batch:
+                    values["category_id"] = category_ids.get(values["category"])
+                connection.execute(insert(Product), [values for _, values in batch])
+            report.inserted += len(batch)
+            return
+        except DBAPIError:
+            pass
+
+        for row, values in batch:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(Product), values)
+                report.inserted += 1
+            except DBAPIError as e:
+                ProductImportService._record_error(report, row, [str(e.orig)])
+
+    @staticmethod
+    def import_file(
+        engine: Engine,
+        source: BinaryIO,
+        file_format: str,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> ProductImportReport:
+        """
+        Stream products from a binary NDJSON/CSV file into the database.
+        Rows are validated against ProductCreate; invalid rows are reported and
+        skipped without aborting the import. Memory use is bounded by one
+        batch plus the capped error list, whatever the file size.
+        Blocking: call from a worker thread when used inside the API.
+        """
+        if file_format not in FORMATS:
+            raise ValueError(f"Unsupported format {file_format!r}, expected one of {FORMATS}")
+
+        text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+        records = _iter_ndjson(text) if file_format == "ndjson" else _iter_csv(text)
+
+        report = ProductImportReport()
+        batch: list[tuple[int, dict]] = []
+        try:
+            for row, record in records:
+                if isinstance(record, json.JSONDecodeError):
+                    ProductImportService._record_error(report, row, [f"Invalid JSON: {record.msg}"])
+                    continue
+                if not isinstance(record, dict):
+                    ProductImportService._record_error(report, row, ["Expected a JSON object"])
+                    continue
+                try:
+                    product = ProductCreate.model_validate(record)
+                except ValidationError as e:
+                    errors = [f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()]
+                    ProductImportService._record_error(report, row, errors)
+                    continue
+
+                batch.append((row, {**product.model_dump(), "rating": 0.0}))
+                if len(batch) >= batch_size:
+                    ProductImportService._insert_batch(engine, batch, report)
+                    batch = []
+
+            if batch:
+                ProductImportService._insert_batch(engine, batch, report)
+        except UnicodeDecodeError as e:
+            ProductImportService._record_error(report, 0, [f"File is not valid UTF-8: {e.reason}"])
+        finally:
+            # Keep the caller's file open (the wrapper would close it on garbage collection)
+            text.detach()
+
+        return report
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, delete, func, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import config
+from app.models.cart_item import CartItem
+from app.models.product import Product
+from app.models.stock_reservation import StockReservation
+from app.schemas.product import ProductStock
+from app.schemas.stock_reservation import BagReservationResponse, ReservedItem
+
+logger = logging.getLogger(__name__)
+
+# Core table, so that the restock UPDATE runs as a plain executemany
+product_table = Product.__table__
+
+
+class InventoryService:
+    """
+    Stock tracking and time-limited reservations.
+    Product.stock holds the units still on sale: reserving takes units off it
+    with a conditional decrement, releasing (or expiry) puts them back.
+    Products with stock = None are not tracked and never run out.
+    """
+
+    @staticmethod
+    async def take_stock(session: AsyncSession, product_id: int, quantity: int) -> bool:
+        """
+        Atomically take `quantity` units of a product off sale.
+        A single UPDATE ... WHERE stock >= :quantity, so concurrent buyers of a
+        hot product can never drive the stock below zero, without any lock
+        held across statements. Returns False if there is not enough stock.
+        """
+        result = await session.exec(
+            update(Product)
+            .where(Product.id == product_id, Product.stock >= quantity)
+            .values(stock=Product.stock - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount == 1
+
+    @staticmethod
+    async def release(session: AsyncSession, *conditions) -> int:
+        """
+        Delete the reservations matching `conditions` and put their units back
+        on sale, in the caller's transaction. DELETE ... RETURNING hands each
+        reservation to exactly one releaser, so a release racing the expiry
+        sweeper never restocks twice. Returns the number of released reservations.
+        """
+        released = (await session.exec(
+            delete(StockReservation)
+            .where(*conditions)
+            .returning(StockReservation.product_id, StockReservation.quantity)
+            .execution_options(synchronize_session=False)
+        )).all()
+
+        restock: dict[int, int] = defaultdict(int)
+        for product_id, quantity in released:
+            restock[product_id] += quantity
+        if restock:
+            await session.exec(
+                update(product_table)
+                .where(product_table.c.id == bindparam("product_id"), product_table.c.stock.is_not(None))
+                .values(stock=product_table.c.stock + bindparam("quantity")),
+                params=[{"product_id": product_id, "quantity": quantity} for product_id, quantity in restock.items()]
+            )
+        return len(released)
+
+    @staticmethod
+    async def reserve_bag(session: AsyncSession, user_id: int) -> BagReservationResponse:
+        """
+        Hold stock for every line of the user's bag for STOCK_RESERVATION_TTL_SECONDS.
+        Replaces the user's previous reservation. All or nothing: if any product
+        is short, nothing is reserved and a 409 lists the short products.
+        """
+        await InventoryService.release(session, StockReservation.user_id == user_id)
+
+        # Product order keeps row locks in the same order for every bag (no deadlocks on Postgres)
+        lines = (await session.exec(
+            select(CartItem.product_id, CartItem.quantity)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.user_id == user_id, Product.stock.is_not(None))
+            .order_by(CartItem.product_id)
+        )).all()
+
+        short = []
+        for product_id, quantity in lines:
+            if not await InventoryService.take_stock(session, product_id, quantity):
+                short.append(product_id)
+        if short:
+            await session.rollback()
+            raise HTTPException(status_code=409, detail=f"Not enough stock for products: {short}")
+
+        if not lines:
+            await session.commit()
+            return BagReservationResponse(user_id=user_id, items=[])
+
+        expires_at = datetime.utcnow() + timedelta(seconds=config.STOCK_RESERVATION_TTL_SECONDS)
+        session.add_all(
+            StockReservation(user_id=user_id, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in lines
+        )
+        await session.commit()
+        return BagReservationResponse(
+            user_id=user_id,
+            items=[ReservedItem(product_id=product_id, quantity=quantity) for product_id, quantity in lines],
+            expires_at=expires_at
+        )
+
+    @staticmethod
+    async def release_bag(session: AsyncSession, user_id: int) -> int:
+        """Give back the stock held for the user's bag. Returns the number of released lines."""
+        released = await InventoryService.release(session, StockReservation.user_id == user_id)
+        await session.commit()
+        return released
+
+    @staticmethod
+    async def release_expired(session: AsyncSession) -> int:
+        """Give back the stock of every expired reservation. Returns the number released."""
+        released = await InventoryService.release(session, StockReservation.expires_at <= datetime.utcnow())
+        await session.commit()
+        return released
+
+    @staticmethod
+    async def run_sweeper(async_engine: AsyncEngine, interval_seconds: float) -> None:
+        """
+        Release expired reservations every `interval_seconds`, until cancelled.
+        Started by the app lifespan; with several API processes every one runs
+        a sweeper, which is safe because release() never restocks twice.
+        """
+        while True:
+            try:
+                async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                    released = await InventoryService.release_expired(session)
+                if released:
+                    logger.info("Released %d expired stock reservations", released)
+            except Exception:
+                # Keep sweeping (e.g. "database is locked" under heavy write load)
+                logger.exception("Stock reservation sweep failed")
+            await asyncio.sleep(interval_seconds)
+
+    @staticmethod
+    async def check_bag_stock(session: AsyncSession, user_id: int, product_ids: Iterable[int]) -> None:
+        """
+        Raise 409 if a bag line for `product_ids` asks for more units than the
+        user can get: the units on sale plus the ones already reserved for them.
+        One query; call after writing the lines, before committing.
+        """
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+
+        reserved = (
+            select(func.coalesce(func.sum(StockReservation.quantity), 0))
+            .where(
+                StockReservation.user_id == CartItem.user_id,
+                StockReservation.product_id == CartItem.product_id,
+                StockReservation.expires_at > datetime.utcnow()
+            )
+            .scalar_subquery()
+        )
+        short = (await session.exec(
+            select(CartItem.product_id)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(
+                CartItem.user_id == user_id,
+                CartItem.product_id.in_(product_ids),
+                Product.stock.is_not(None),
+                CartItem.quantity > Product.stock + reserved
+            )
+            .order_by(CartItem.product_id)
+        )).all()
+        if short:
+            raise HTTPException(status_code=409, detail=f"Not enough stock for products: {list(short)}")
+
+    @staticmethod
+    async def get_stock(session: AsyncSession, product_id: int) -> ProductStock:
+        """Units on sale and units held by active reservations for one product."""
+        product = await session.get(Product, product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+
+        reserved = (await session.exec(
+            select(func.coalesce(func.sum(StockReservation.quantity), 0))
+            .where(StockReservation.product_id == product_id, StockReservation.expires_at > datetime.utcnow())
+        )).one()
+        return ProductStock(product_id=product_id, stock=product.stock, reserved=reserved)
+
+    @staticmethod
+    async def set_stock(session: AsyncSession, product_id: int, stock: int | None) -> ProductStock:
+        """Set the units on sale (after a restock or stock count); None stops tracking."""
+        product = await session.get(Product, product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+
+        product.stock = stock
+        session.add(product)
+        await session.commit()
+        return await InventoryService.get_stock(session, product_id)
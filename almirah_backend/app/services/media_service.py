@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional
+
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+
+from app.core import config
+
+# Directory for storing uploaded images (served under /static/images)
+UPLOAD_DIR = Path("static/images")
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+UPLOAD_URL_PREFIX = "/static/images"
+
+# Uploads are copied to disk in chunks of this size, never read whole into memory
+CHUNK_SIZE = 64 * 1024
+
+# In-progress uploads are written to a temp file before being renamed to their hash
+TEMP_PREFIX = ".upload-"
+TEMP_SUFFIX = ".part"
+
+# Stored images are named <sha256>.<ext>; their variants <sha256>_<width>w.webp / <sha256>.webp
+CONTENT_ADDRESSED_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})(_\d+w)?\.\w+$")
+# Derived variant files of any stored image (hashed or legacy uuid name)
+VARIANT_NAME = re.compile(r"^(?P<stem>.+?)(_\d+w)?\.webp$")
+
+# Widths (px) of the generated thumbnails
+THUMBNAIL_WIDTHS = (200, 400, 800)
+WEBP_QUALITY = 80
+
+# Resizing/encoding is CPU-bound, so it runs in a small dedicated pool
+# instead of the event loop or the request threadpool
+_image_pool = ThreadPoolExecutor(
+    max_workers=config.MEDIA_WORKERS,
+    thread_name_prefix="image-variants"
+)
+
+
+def _reuse_existing(path: Path) -> bool:
+    """
+    Bump the mtime of an already stored file that a new upload reuses, so
+    collect_garbage (which spares young files) does not remove it before the
+    row referencing it is committed. False if the file does not exist.
+    """
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _store_content_addressed(source: BinaryIO, extension: str, max_bytes: int) -> str:
+    """
+    Stream `source` to disk chunk by chunk while hashing it (runs in a worker thread).
+    The file is named after its SHA-256, so re-uploading the same image reuses
+    the stored copy instead of writing a duplicate. Returns the filename.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    temp_path = UPLOAD_DIR / f"{TEMP_PREFIX}{uuid.uuid4().hex}{TEMP_SUFFIX}"
+    try:
+        with open(temp_path, "wb") as buffer:
+            while chunk := source.read(CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise HTTPException(status_code=413, detail="Image is too large")
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        filename = f"{digest.hexdigest()}{extension}"
+        final_path = UPLOAD_DIR / filename
+        if not _reuse_existing(final_path):
+            # Atomic, so readers never see a half-written image
+            os.replace(temp_path, final_path)
+        return filename
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def _generate_variants(original: Path) -> dict[str, str]:
+    """
+    Create the resized WebP thumbnails and a full-size WebP copy next to `original`.
+    Returns the variant URLs keyed by name ("200w", "400w", "800w", "webp").
+    Images are never upscaled: a thumbnail wider than the original keeps the original size.
+    """
+    variants = {}
+    with Image.open(original) as image:
+        # Respect camera rotation, then drop to a mode WebP can encode
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+
+        for width in THUMBNAIL_WIDTHS:
+            name = f"{original.stem}_{width}w.webp"
+            # Variants of a content-addressed image only depend on its content,
+            # so a duplicate upload reuses the ones already on disk
+            if not _reuse_existing(original.with_name(name)):
+                thumbnail = image.copy()
+                # Width-bound box (tall images may be up to 4x as high as wide)
+                thumbnail.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+                thumbnail.save(original.with_name(name), "WEBP", quality=WEBP_QUALITY, method=4)
+            variants[f"{width}w"] = f"{UPLOAD_URL_PREFIX}/{name}"
+
+        name = f"{original.stem}.webp"
+        if not _reuse_existing(original.with_name(name)):
+            image.save(original.with_name(name), "WEBP", quality=WEBP_QUALITY, method=4)
+        variants["webp"] = f"{UPLOAD_URL_PREFIX}/{name}"
+
+    return variants
+
+
+class MediaService:
+    """Image upload handling shared by the product and category routers."""
+
+    @staticmethod
+    async def save_upload(file: UploadFile) -> str:
+        """
+        Save an uploaded file under its content hash and return its URL path.
+        The copy runs off the event loop, in chunks, so large uploads neither
+        block other requests nor get loaded into memory at once.
+        """
+        file_extension = Path(file.filename).suffix.lower() if file.filename else ""
+        file_extension = file_extension or ".jpg"
+
+        try:
+            filename = await run_in_threadpool(
+                _store_content_addressed, file.file, file_extension, config.MEDIA_MAX_UPLOAD_BYTES
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+
+        # Return URL path (relative to static mount) - stored as /static/images/... for Flutter compatibility
+        return f"{UPLOAD_URL_PREFIX}/{filename}"
+
+    @staticmethod
+    def generate_variants(image_url: str) -> Optional[dict[str, str]]:
+        """
+        Generate thumbnails and WebP variants for a saved image (blocking).
+        Returns None (the original image is still served) if the file cannot be decoded.
+        """
+        try:
+            return _generate_variants(UPLOAD_DIR / Path(image_url).name)
+        except (UnidentifiedImageError, OSError, ValueError):
+            return None
+
+    @staticmethod
+    async def create_variants(image_url: str) -> Optional[dict[str, str]]:
+        """Same as generate_variants, run in the image pool so the event loop stays free."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_image_pool, MediaService.generate_variants, image_url)
+
+    @staticmethod
+    def collect_garbage(
+        referenced_urls: Iterable[str],
+        min_age_seconds: float = 3600,
+        dry_run: bool = False
+    ) -> list[Path]:
+        """
+        Delete files in UPLOAD_DIR that no product or category references.
+        A file is kept if it is referenced directly, or if it is a variant
+        (thumbnail/WebP) of a referenced image. Files younger than
+        `min_age_seconds` are always kept, so an upload whose DB row is not
+        committed yet is never removed (a duplicate upload reusing a stored
+        file makes it young again, see _reuse_existing). Returns the removed (or, with
+        dry_run, removable) paths.
+        """
+        referenced_names = {Path(url).name for url in referenced_urls if url}
+        referenced_stems = {Path(name).stem for name in referenced_names}
+        cutoff = time.time() - min_age_seconds
+
+        removed = []
+        for path in UPLOAD_DIR.iterdir():
+            if not path.is_file() or path.name in referenced_names:
+                continue
+            variant = VARIANT_NAME.match(path.name)
+            if variant and variant.group("stem") in referenced_stems:
+                continue
+            if path.stat().st_mtime > cutoff:
+                continue
+            if not dry_run:
+                path.unlink(missing_ok=True)
+            removed.append(path)
+        return removed
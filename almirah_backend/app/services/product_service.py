@@ -0,0 +1,227 @@
+import base64
+import binascii
+import json
+import math
+from enum import Enum
+from typing import Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_, select as sa_select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.serialization import public_fields
+from app.models.category import Category
+from app.models.product import Product, effective_price
+from app.schemas.product import ProductPublic
+
+
+class ProductSort(str, Enum):
+    """Sort orders supported by GET /products/ ("-" prefix = descending)."""
+    ID = "id"
+    ID_DESC = "-id"
+    PRICE_ASC = "price"
+    PRICE_DESC = "-price"
+    EFFECTIVE_PRICE_ASC = "effective_price"
+    EFFECTIVE_PRICE_DESC = "-effective_price"
+    RATING_ASC = "rating"
+    RATING_DESC = "-rating"
+
+
+# Column expression each sort key orders by (id is always the tie-breaker)
+SORT_COLUMNS = {
+    "id": Product.id,
+    "price": Product.price,
+    "effective_price": effective_price,
+    "rating": Product.rating,
+}
+
+# Product columns the cursor of each sort key is built from (besides id)
+SORT_FIELDS = {
+    "id": (),
+    "price": ("price",),
+    "effective_price": ("price", "discount_price"),
+    "rating": ("rating",),
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Distinct ids accepted by one batch lookup
+MAX_BATCH_IDS = 200
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value) -> bool:
+    return (_is_int(value) or isinstance(value, float)) and math.isfinite(value)
+
+
+class ProductService:
+    """Business logic for product listing and lookups."""
+
+    @staticmethod
+    def encode_cursor(sort: ProductSort, product) -> str:
+        """
+        Build the opaque cursor pointing just after `product` (a Product or a
+        projected row holding the sort columns).
+        The cursor carries the sort key it was issued for, so a cursor
+        cannot be replayed against a different ordering.
+        """
+        key = sort.value.lstrip("-")
+        if key == "effective_price":
+            value = product.discount_price if product.discount_price is not None else product.price
+        else:
+            value = getattr(product, key)
+        payload = json.dumps([sort.value, value, product.id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(sort: ProductSort, cursor: str) -> tuple:
+        """
+        Decode a cursor into (sort_value, last_id). Raises 400 if invalid.
+        Every sort column is NOT NULL (effective price falls back to the
+        price), so the sort value must be a finite number and the id an int.
+        """
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            sort_value, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        except (ValueError, TypeError, binascii.Error):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        if sort_value != sort.value or not _is_int(last_id):
+            raise HTTPException(status_code=400, detail="Cursor does not match the requested sort")
+        valid_value = _is_int(value) if sort.value.lstrip("-") == "id" else _is_number(value)
+        if not valid_value:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return value, last_id
+
+    @staticmethod
+    async def list_products(
+        session: AsyncSession,
+        limit: Optional[int] = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        sort: ProductSort = ProductSort.ID,
+        category: Optional[str] = None,
+        category_id: Optional[int] = None,
+        brand: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        discounted: bool = False,
+        fields: Optional[Sequence[str]] = None,
+    ) -> tuple[Sequence[Product], Optional[str]]:
+        """
+        Fetch one page of products using keyset (seek) pagination.
+        Returns: (products, next_cursor)
+        - next_cursor is None when there are no more pages
+        `limit=None` returns every matching product in one list (no cursor).
+        `category` filters by category name, `category_id` by id (both go
+        through the indexed Product.category_id; products whose category
+        name has no Category row yet are matched by name).
+        With `fields` (ProductPublic field names) only those columns, plus
+        what the cursor needs, are selected: the rows are then Row tuples
+        rather than Product objects.
+        Instead of OFFSET, each page seeks past the last (sort_key, id) seen,
+        so a page deep in the catalog costs the same as the first one.
+        """
+        key = sort.value.lstrip("-")
+        descending = sort.value.startswith("-")
+        sort_column = SORT_COLUMNS[key]
+
+        if fields is None:
+            statement = select(Product)
+        else:
+            load = {"id", *fields, *SORT_FIELDS[key]}
+            statement = sa_select(*(getattr(Product, field) for field in public_fields(ProductPublic) if field in load))
+
+        # Filters
+        if category:
+            statement = statement.where(or_(
+                Product.category_id == select(func.min(Category.id)).where(Category.name == category).scalar_subquery(),
+                and_(Product.category_id.is_(None), Product.category == category)
+            ))
+        if category_id is not None:
+            statement = statement.where(Product.category_id == category_id)
+        if brand:
+            statement = statement.where(Product.brand == brand)
+        if min_price is not None:
+            statement = statement.where(effective_price >= min_price)
+        if max_price is not None:
+            statement = statement.where(effective_price <= max_price)
+        if discounted:
+            statement = statement.where(Product.discount_price.is_not(None))
+
+        # Seek past the last row of the previous page
+        if cursor:
+            value, last_id = ProductService.decode_cursor(sort, cursor)
+            if key == "id":
+                position = Product.id < last_id if descending else Product.id > last_id
+            # Spelled out instead of a (key, id) row-value comparison: SQLite
+            # only seeks an expression index (effective price) with this form
+            elif descending:
+                position = and_(
+                    sort_column <= value,
+                    or_(sort_column < value, Product.id < last_id)
+                )
+            else:
+                position = and_(
+                    sort_column >= value,
+                    or_(sort_column > value, Product.id > last_id)
+                )
+            statement = statement.where(position)
+
+        # Ordering (id breaks ties in the same direction so the index can be walked)
+        if key == "id":
+            order_by = [Product.id.desc() if descending else Product.id]
+        elif descending:
+            order_by = [sort_column.desc(), Product.id.desc()]
+        else:
+            order_by = [sort_column, Product.id]
+
+        statement = statement.order_by(*order_by)
+        if limit is None:
+            return list((await session.exec(statement)).all()), None
+
+        # Fetch one extra row to know whether another page exists
+        products: List[Product] = list((await session.exec(statement.limit(limit + 1))).all())
+
+        next_cursor = None
+        if len(products) > limit:
+            products = products[:limit]
+            next_cursor = ProductService.encode_cursor(sort, products[-1])
+
+        return products, next_cursor
+
+    @staticmethod
+    def unique_ids(ids: Iterable[int]) -> list[int]:
+        """Drop repeated ids, keeping first-seen order. Raises 400 beyond MAX_BATCH_IDS."""
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > MAX_BATCH_IDS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} distinct ids per request")
+        return ids
+
+    @staticmethod
+    def parse_ids(values: Iterable[str]) -> list[int]:
+        """Ids from ?ids=1,2,3 (repeated ?ids= also works), deduplicated. Raises 400 if invalid."""
+        try:
+            ids = [int(part) for value in values for part in value.split(",") if part.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+        if not ids:
+            raise HTTPException(status_code=400, detail="No product ids given")
+        return ProductService.unique_ids(ids)
+
+    @staticmethod
+    async def get_products(session: AsyncSession, ids: Sequence[int]) -> tuple[list[Product], list[int]]:
+        """
+        Look up products by id with a single IN query.
+        Returns: (products in the order of `ids`, ids with no product)
+        """
+        ids = ProductService.unique_ids(ids)
+        found = {
+            product.id: product
+            for product in (await session.exec(select(Product).where(Product.id.in_(ids)))).all()
+        }
+        products = [found[product_id] for product_id in ids if product_id in found]
+        return products, [product_id for product_id in ids if product_id not in found]
@@ -0,0 +1,160 @@
+import re
+from typing import Optional, Sequence
+
+from sqlalchemy import column, func, literal_column, or_, table, text
+from sqlalchemy.engine import Connection
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models.product import Product
+
+# FTS5 virtual table mirroring the searchable Product columns.
+# It is an "external content" table: it stores only the search index and
+# reads the column values back from the product table, keyed by rowid = product.id.
+FTS_TABLE = "product_fts"
+
+# BM25 column weights, in the same order as the FTS columns below
+# (a hit in the name counts more than a hit in the description)
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+
+CREATE_FTS_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name, brand, description, category,
+    content='product', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+)
+"""
+
+# Triggers keep the index in sync with every write to the product table,
+# whichever code path performs it (API handlers, imports, manual SQL).
+# Updates re-index only when a searchable column changes, so stock and
+# price writes (e.g. reservations decrementing stock) leave the index alone
+FTS_COLUMNS = "name, brand, description, category"
+FTS_TRIGGERS = {
+    "product_fts_after_insert": f"""
+    CREATE TRIGGER product_fts_after_insert AFTER INSERT ON product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS})
+        VALUES (new.id, new.name, new.brand, new.description, new.category);
+    END
+    """,
+    "product_fts_after_delete": f"""
+    CREATE TRIGGER product_fts_after_delete AFTER DELETE ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {FTS_COLUMNS})
+        VALUES ('delete', old.id, old.name, old.brand, old.description, old.category);
+    END
+    """,
+    "product_fts_after_update": f"""
+    CREATE TRIGGER product_fts_after_update AFTER UPDATE OF {FTS_COLUMNS} ON product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {FTS_COLUMNS})
+        VALUES ('delete', old.id, old.name, old.brand, old.description, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS})
+        VALUES (new.id, new.name, new.brand, new.description, new.category);
+    END
+    """,
+}
+
+# Anything that is not a letter/digit is treated as a separator, which also
+# strips FTS5 query syntax (quotes, *, ^, parentheses, column filters)
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class SearchService:
+    """Full-text product search backed by an SQLite FTS5 index."""
+
+    @staticmethod
+    def create_index(connection: Connection) -> None:
+        """
+        Create the FTS table if it doesn't exist and (re)create its sync
+        triggers, so existing databases pick up trigger changes.
+        A freshly created index is backfilled from the existing products.
+        FTS5 is SQLite-only; on other databases this is a no-op and
+        search_products falls back to plain substring matching.
+        """
+        if connection.dialect.name != "sqlite":
+            return
+
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE}
+        ).first()
+
+        connection.execute(text(CREATE_FTS_TABLE))
+        for name, statement in FTS_TRIGGERS.items():
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            connection.execute(text(statement))
+
+        if not exists:
+            SearchService.rebuild_index(connection)
+
+    @staticmethod
+    def rebuild_index(connection: Connection) -> None:
+        """Re-index every product from scratch (repairs or backfills the index)."""
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+    @staticmethod
+    def build_match_query(query: str) -> Optional[str]:
+        """
+        Turn free text typed by a user into a safe FTS5 MATCH expression.
+        Every word is quoted (so user input cannot inject FTS syntax) and all
+        words must match; the last one is a prefix match for type-ahead.
+        Returns None if the query has no searchable words.
+        """
+        tokens = TOKEN_PATTERN.findall(query)
+        if not tokens:
+            return None
+
+        terms = [f'"{token}"' for token in tokens]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+    @staticmethod
+    async def search_products(
+        session: AsyncSession,
+        query: str,
+        limit: int,
+        offset: int = 0
+    ) -> Sequence[Product]:
+        """Return products matching `query`, best BM25 match first."""
+        if session.bind.dialect.name != "sqlite":
+            return await SearchService.search_products_fallback(session, query, limit, offset)
+
+        match_query = SearchService.build_match_query(query)
+        if match_query is None:
+            return []
+
+        fts = table(FTS_TABLE, column("rowid"))
+        # The hidden column named after the table is what MATCH and bm25() take
+        fts_column = literal_column(FTS_TABLE)
+        statement = (
+            select(Product)
+            .join(fts, fts.c.rowid == Product.id)
+            .where(fts_column.op("MATCH")(match_query))
+            .order_by(func.bm25(fts_column, *BM25_WEIGHTS), Product.id)
+            .offset(offset)
+            .limit(limit)
+        )
+        return (await session.exec(statement)).all()
+
+    @staticmethod
+    async def search_products_fallback(
+        session: AsyncSession,
+        query: str,
+        limit: int,
+        offset: int = 0
+    ) -> Sequence[Product]:
+        """Unranked substring search for databases without FTS5: every word must appear somewhere."""
+        tokens = TOKEN_PATTERN.findall(query)
+        if not tokens:
+            return []
+
+        statement = select(Product)
+        for token in tokens:
+            pattern = f"%{token}%"
+            statement = statement.where(or_(
+                Product.name.ilike(pattern),
+                Product.brand.ilike(pattern),
+                Product.description.ilike(pattern),
+                Product.category.ilike(pattern),
+            ))
+        return (await session.exec(statement.order_by(Product.id).offset(offset).limit(limit))).all()
@@ -0,0 +1,323 @@
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import delete, func, insert, or_, select as sa_select
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.core import config
+from app.models.product import Product
+from app.models.similar_product import SimilarProduct
+from app.services.catalog_cache import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+# Core table, so that the neighbour rows are written with a plain executemany
+similar_table = SimilarProduct.__table__
+
+# How a candidate's score is made up (products are only compared within their
+# category). Each part is in [0, 1], so scores are too
+TEXT_WEIGHT = 0.6  # TF-IDF cosine similarity of name + description
+BRAND_WEIGHT = 0.25  # Same brand
+PRICE_WEIGHT = 0.15  # Price proximity, see PRICE_BAND
+# Price ratio at which the price part drops to 1/e (1.5 = 50% dearer or cheaper)
+PRICE_BAND = math.log(1.5)
+
+# Rows of the score matrix computed at once (bounds memory to CHUNK_ROWS x category size)
+CHUNK_ROWS = 1024
+
+# Words of 2+ letters (digits, sizes and SKU-like tokens are not descriptive)
+TOKEN_PATTERN = re.compile(r"[^\W\d_]{2,}", re.UNICODE)
+
+BLOCK_COLUMNS = (
+    Product.id, Product.name, Product.description, Product.brand,
+    Product.price, Product.discount_price, Product.category_id, Product.category,
+)
+
+
+def _block_key(row) -> tuple:
+    """Products are compared within their category (by id, or by name for unlinked legacy rows)."""
+    return ("id", row.category_id) if row.category_id is not None else ("name", row.category)
+
+
+def _block_condition(key: tuple):
+    kind, value = key
+    if kind == "id":
+        return Product.category_id == value
+    return (Product.category_id.is_(None)) & (Product.category == value)
+
+
+def tfidf_matrix(texts: Sequence[str], max_terms: int) -> np.ndarray:
+    """
+    L2-normalised TF-IDF rows (float32, one per text) with sublinear term
+    frequency. Terms found in a single text cannot make two texts similar, so
+    the vocabulary keeps only shared terms, at most `max_terms` of the most shared.
+    """
+    documents = [TOKEN_PATTERN.findall(text.lower()) for text in texts]
+    document_frequency = Counter(term for tokens in documents for term in set(tokens))
+    terms = sorted(
+        (term for term, count in document_frequency.items() if count >= 2),
+        key=lambda term: (-document_frequency[term], term)
+    )[:max_terms]
+    vocabulary = {term: index for index, term in enumerate(terms)}
+
+    rows, columns = [], []
+    for row, tokens in enumerate(documents):
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                rows.append(row)
+                columns.append(column)
+
+    matrix = np.zeros((len(documents), len(terms)), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)), 1.0)
+    present = matrix > 0
+    matrix[present] = 1.0 + np.log(matrix[present])
+
+    frequencies = np.array([document_frequency[term] for term in terms], dtype=np.float32)
+    matrix *= np.log((1.0 + len(documents)) / (1.0 + frequencies)) + 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class _Block:
+    """Features of the products of one category, ready for vectorised scoring."""
+
+    def __init__(self, rows: Sequence):
+        self.ids = np.array([row.id for row in rows], dtype=np.int64)
+        self.position = {int(product_id): index for index, product_id in enumerate(self.ids)}
+        self.text = tfidf_matrix(
+            [f"{row.name} {row.description or ''}" for row in rows], config.SIMILAR_MAX_TERMS
+        )
+        _, self.brands = np.unique([row.brand.strip().lower() for row in rows], return_inverse=True)
+        prices = np.array(
+            [row.discount_price if row.discount_price is not None else row.price for row in rows], dtype=np.float64
+        )
+        self.log_prices = np.log(np.maximum(prices, 0.01)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scores(self, positions: np.ndarray) -> np.ndarray:
+        """Score matrix of the products at `positions` against the whole block (self = -inf)."""
+        scores = TEXT_WEIGHT * (self.text[positions] @ self.text.T)
+        scores += BRAND_WEIGHT * (self.brands[positions, None] == self.brands[None, :])
+        price_distance = np.abs(self.log_prices[positions, None] - self.log_prices[None, :])
+        scores += PRICE_WEIGHT * np.exp(-price_distance / PRICE_BAND)
+        scores[np.arange(len(positions)), positions] = -np.inf
+        return scores
+
+    def neighbours(self, positions: Iterable[int], k: int) -> list[dict]:
+        """similarproduct rows (top `k`, best first) for the products at `positions`."""
+        positions = np.fromiter(positions, dtype=np.intp)
+        k = min(k, len(self) - 1)
+        if k <= 0 or not len(positions):
+            return []
+
+        rows = []
+        for start in range(0, len(positions), CHUNK_ROWS):
+            chunk = positions[start:start + CHUNK_ROWS]
+            scores = self.scores(chunk)
+            # Unordered top k per row, then sorted: O(n) + O(k log k) instead of a full sort
+            top = np.argpartition(scores, -k, axis=1)[:, -k:]
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for product_id, similar, similar_scores in zip(self.ids[chunk], top, top_scores):
+                rows.extend(
+                    {"product_id": int(product_id), "rank": rank, "similar_id": int(self.ids[index]), "score": float(score)}
+                    for rank, (index, score) in enumerate(zip(similar, similar_scores), 1)
+                )
+        return rows
+
+
+class SimilarityService:
+    """
+    "Similar products" from a precomputed top-K neighbour table.
+    Candidates come from the product's own category and are ranked by
+    TF-IDF similarity of name + description, same brand and price
+    proximity, computed with vectorised NumPy one category at a time. The
+    table is built offline (`python -m app.manage build-similar`) and kept
+    up to date incrementally as products are created and deleted.
+    Blocking (NumPy + sync engine): run from a worker thread inside the API.
+    """
+
+    @staticmethod
+    def _load_block(connection: Connection, key: tuple) -> _Block:
+        rows = connection.execute(sa_select(*BLOCK_COLUMNS).where(_block_condition(key)).order_by(Product.id)).all()
+        return _Block(rows)
+
+    @staticmethod
+    def _replace_rows(connection: Connection, product_ids: Sequence[int], rows: list[dict]) -> None:
+        connection.execute(delete(similar_table).where(similar_table.c.product_id.in_(product_ids)))
+        if rows:
+            connection.execute(insert(similar_table), rows)
+
+    @staticmethod
+    def build_index(engine: Engine, k: Optional[int] = None) -> int:
+        """Rebuild the whole neighbour table. Returns the number of products indexed."""
+        k = k or config.SIMILAR_PRODUCTS_K
+        with engine.connect() as connection:
+            products = connection.execute(sa_select(*BLOCK_COLUMNS).order_by(Product.id)).all()
+
+        blocks = defaultdict(list)
+        for row in products:
+            blocks[_block_key(row)].append(row)
+
+        # Computed before the write transaction, so writers are only blocked for the insert
+        rows = []
+        for block_rows in blocks.values():
+            block = _Block(block_rows)
+            rows.extend(block.neighbours(range(len(block)), k))
+
+        with engine.begin() as connection:
+            connection.execute(delete(similar_table))
+            if rows:
+                connection.execute(insert(similar_table), rows)
+        logger.info("Similar products index built for %d products (%d rows)", len(products), len(rows))
+        return len(products)
+
+    @staticmethod
+    def build_index_if_empty(engine: Engine) -> bool:
+        """
+        Backfill: build the index if it has no rows but there are products
+        to compare (a new table on an existing database). Returns True if built.
+        """
+        with engine.connect() as connection:
+            indexed = connection.execute(sa_select(similar_table.c.product_id).limit(1)).first()
+            products = connection.execute(sa_select(func.count(Product.id))).scalar_one()
+        if indexed is None and products > 1:
+            SimilarityService.build_index(engine)
+            return True
+        return False
+
+    @staticmethod
+    async def run_backfill(engine: Engine) -> None:
+        """
+        build_index_if_empty in a worker thread, started by the app lifespan
+        so a large catalog does not hold up startup (until then the
+        endpoint answers []). `python -m app.manage build-similar` does the
+        same offline.
+        """
+        try:
+            if await run_in_threadpool(SimilarityService.build_index_if_empty, engine):
+                catalog_cache.invalidate()
+        except Exception:
+            logger.exception("Similar products backfill failed")
+
+    @staticmethod
+    def refresh_category(engine: Engine, category_id: int) -> None:
+        """
+        Recompute the lists of every product of a category, e.g. after
+        products were linked to it and so moved between comparison blocks.
+        """
+        with engine.connect() as connection:
+            product_ids = connection.execute(
+                sa_select(Product.id).where(Product.category_id == category_id)
+            ).scalars().all()
+        SimilarityService.refresh_products(engine, product_ids)
+
+    @staticmethod
+    def refresh_products(engine: Engine, product_ids: Iterable[int], k: Optional[int] = None) -> None:
+        """Recompute the neighbour lists of `product_ids` (one scoring pass per category)."""
+        k = k or config.SIMILAR_PRODUCTS_K
+        product_ids = list(set(product_ids))
+        if not product_ids:
+            return
+        with engine.connect() as connection:
+            products = connection.execute(
+                sa_select(Product.id, Product.category_id, Product.category).where(Product.id.in_(product_ids))
+            ).all()
+            by_block = defaultdict(list)
+            for row in products:
+                by_block[_block_key(row)].append(row.id)
+
+            rows = []
+            for key, ids in by_block.items():
+                block = SimilarityService._load_block(connection, key)
+                rows.extend(block.neighbours((block.position[product_id] for product_id in ids), k))
+
+        with engine.begin() as connection:
+            SimilarityService._replace_rows(connection, product_ids, rows)
+
+    @staticmethod
+    def add_product(engine: Engine, product_id: int, k: Optional[int] = None) -> None:
+        """
+        Fold a new product into the index: compute its own neighbours, and
+        recompute the lists of the products it now belongs in (scores are
+        symmetric, so its score row tells which lists it beats the last entry of).
+        Untouched lists keep the IDF weights of their last computation, which
+        drift slightly as the category grows; `build-similar` recomputes all.
+        """
+        k = k or config.SIMILAR_PRODUCTS_K
+        with engine.connect() as connection:
+            product = connection.execute(
+                sa_select(Product.id, Product.category_id, Product.category).where(Product.id == product_id)
+            ).first()
+            if product is None:
+                return  # Deleted in the meantime
+            key = _block_key(product)
+            block = SimilarityService._load_block(connection, key)
+            position = block.position[product_id]
+            new_scores = block.scores(np.array([position]))[0]
+
+            # Size and weakest score of the current lists in the category
+            lists = connection.execute(
+                sa_select(similar_table.c.product_id, func.count(), func.min(similar_table.c.score))
+                .join(Product, Product.id == similar_table.c.product_id)
+                .where(_block_condition(key))
+                .group_by(similar_table.c.product_id)
+            ).all()
+            current = {row[0]: (row[1], row[2]) for row in lists}
+
+        full = min(k, len(block) - 1)
+        affected = [
+            int(other_id) for other_id, score in zip(block.ids, new_scores)
+            if other_id != product_id
+            and (current.get(int(other_id), (0, None))[0] < full or score > current[int(other_id)][1])
+        ]
+        positions = [position, *(block.position[other_id] for other_id in affected)]
+        rows = block.neighbours(positions, k)
+        with engine.begin() as connection:
+            SimilarityService._replace_rows(connection, [product_id, *affected], rows)
+
+    @staticmethod
+    async def detach_product(session: AsyncSession, product_id: int) -> list[int]:
+        """
+        Delete a product's neighbour rows (its own list and its entries in
+        other lists) in the caller's transaction, before the product itself,
+        so databases enforcing foreign keys accept the delete. Not committed.
+        Returns the products whose lists lost an entry: refill them with
+        refresh_products once committed.
+        """
+        affected = (await session.exec(
+            sa_select(similar_table.c.product_id).distinct().where(similar_table.c.similar_id == product_id)
+        )).scalars().all()
+        await session.exec(
+            delete(similar_table).where(
+                or_(similar_table.c.product_id == product_id, similar_table.c.similar_id == product_id)
+            )
+        )
+        return [other_id for other_id in affected if other_id != product_id]
+
+    @staticmethod
+    async def get_similar(session: AsyncSession, product_id: int, limit: int) -> list[Product]:
+        """
+        The `limit` most similar products, best first: one primary-key range
+        read of the neighbour table joined to the products.
+        """
+        return list((await session.exec(
+            select(Product)
+            .join(SimilarProduct, SimilarProduct.similar_id == Product.id)
+            .where(SimilarProduct.product_id == product_id)
+            .order_by(SimilarProduct.rank)
+            .limit(limit)
+        )).all())
@@ -0,0 +1 @@
+# Benchmarks package - performance checks run against a throwaway database
@@ -0,0 +1,336 @@
+"""
+Reproducible load test of the whole API.
+
+Seeds a synthetic catalog (--products products, --users users with a few
+items in their bags) into a throwaway SQLite database, then drives a
+weighted mix of realistic traffic against the app:
+
+  browse   GET /products/ (random category/brand filter and sort, follows the cursor)
+  search   GET /products/search
+  add      POST /cart/add
+  details  GET /cart/details
+  summary  GET /cart/summary
+
+either in-process (httpx over ASGI, no network: measures the app itself) or
+over HTTP against a local uvicorn started on the same database (--server
+uvicorn: includes the server and the HTTP stack). Reports throughput and
+p50/p95/p99 latency per scenario.
+
+Everything random comes from --seed, so two runs see the same catalog and
+the same request sequence per worker.
+
+Baselines: --save-baseline FILE stores the results; --baseline FILE compares
+against them and exits with status 1 if a scenario's p95 latency grew, or
+its throughput dropped, by more than --tolerance. Baselines are only
+comparable on the same machine with the same options.
+
+Run from the almirah_backend directory:
+    python -m benchmarks.api_load [--products 100000] [--users 10000] [--seconds 20] [--concurrency 32]
+    python -m benchmarks.api_load --server uvicorn --save-baseline /tmp/baseline.json
+    python -m benchmarks.api_load --server uvicorn --baseline /tmp/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+BRANDS = [
+    "Zara", "Mango", "Uniqlo", "Levis", "Puma", "Nike", "Adidas", "Biba", "Fabindia", "Manyavar",
+    "Allen Solly", "Van Heusen", "Roadster", "HRX", "Only", "Vero Moda", "W", "Aurelia", "Libas", "Jack Jones",
+]
+CATEGORIES = ["Tops", "Dresses", "Jeans", "Shirts", "T-Shirts", "Kurtas", "Sarees", "Jackets", "Shoes", "Bags", "Watches", "Ethnic"]
+COLORS = ["black", "white", "red", "navy", "olive", "beige", "pink", "mustard", "maroon", "teal", "grey", "lavender"]
+FABRICS = ["cotton", "linen", "denim", "silk", "rayon", "wool", "chiffon", "georgette", "leather", "polyester"]
+STYLES = ["slim", "relaxed", "oversized", "cropped", "printed", "embroidered", "striped", "solid", "floral", "checked"]
+SORTS = ["id", "-id", "price", "-price", "effective_price", "-effective_price", "rating", "-rating"]
+
+DEFAULT_MIX = "browse=45,search=15,add=15,details=15,summary=10"
+BAG_ITEMS = 3
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {sorted(SCENARIOS)}")
+        mix[name] = int(weight)
+    return mix
+
+
+def seed_database(products: int, users: int, seed: int) -> None:
+    """Fill the database at DATABASE_URL (already set in the environment) with synthetic data."""
+    from sqlalchemy import insert
+
+    from app.core.database import create_db_and_tables, engine
+    from app.models.cart_item import CartItem
+    from app.models.category import Category
+    from app.models.product import Product
+    from app.models.user import User
+
+    rng = random.Random(seed)
+    create_db_and_tables()
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(Category), [
+            {"name": category, "image_url": f"/static/images/{category.lower()}.jpg"} for category in CATEGORIES
+        ])
+        category_ids = {category: index for index, category in enumerate(CATEGORIES, 1)}
+        batch = []
+        for i in range(products):
+            price = round(rng.uniform(199, 9999), 2)
+            style, color, fabric = rng.choice(STYLES), rng.choice(COLORS), rng.choice(FABRICS)
+            category = rng.choice(CATEGORIES)
+            batch.append({
+                "brand": rng.choice(BRANDS),
+                "name": f"{style.title()} {color} {fabric} {category.lower()} {i}",
+                "description": f"{style} fit {fabric} {category.lower()} in {color}",
+                "price": price,
+                "discount_price": round(price * rng.uniform(0.5, 0.9), 2) if rng.random() < 0.4 else None,
+                "rating": round(rng.uniform(1, 5), 1),
+                "image_url": f"/static/images/{i}.jpg",
+                "category": category,
+                "category_id": category_ids[category],
+            })
+            if len(batch) == 5000:
+                connection.execute(insert(Product), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(Product), batch)
+
+        connection.execute(insert(User), [{"name": f"User {i}"} for i in range(users)])
+        connection.execute(insert(CartItem), [
+            {"user_id": user_id, "product_id": product_id, "quantity": rng.randint(1, 3), "created_at": now, "updated_at": now}
+            for user_id in range(1, users + 1)
+            for product_id in rng.sample(range(1, products + 1), BAG_ITEMS)
+        ])
+    engine.dispose()
+
+
+# Scenarios: each takes the client, the worker's RNG and the options, and returns the response
+
+async def browse(client: httpx.AsyncClient, rng: random.Random, options) -> httpx.Response:
+    params = {"limit": rng.choice([20, 50]), "sort": rng.choice(SORTS)}
+    roll = rng.random()
+    if roll < 0.5:
+        params["category"] = rng.choice(CATEGORIES)
+    elif roll < 0.7:
+        params["brand"] = rng.choice(BRANDS)
+    response = await client.get("/products/", params=params)
+    # A third of the visitors scroll to the next page
+    cursor = response.headers.get("x-next-cursor")
+    if cursor and rng.random() < 0.33:
+        response = await client.get("/products/", params={**params, "cursor": cursor})
+    return response
+
+
+async def search(client: httpx.AsyncClient, rng: random.Random, options) -> httpx.Response:
+    words = [rng.choice(COLORS), rng.choice(FABRICS), rng.choice(CATEGORIES).lower()]
+    query = " ".join(words[:rng.randint(1, 3)])
+    # Type-ahead: sometimes only the beginning of the last word
+    if rng.random() < 0.3:
+        query = query[:-2]
+    return await client.get("/products/search", params={"q": query, "limit": 20})
+
+
+async def add(client: httpx.AsyncClient, rng: random.Random, options) -> httpx.Response:
+    return await client.post("/cart/add", json={
+        "user_id": rng.randint(1, options.users),
+        "product_id": rng.randint(1, options.products),
+        "quantity": 1,
+    })
+
+
+async def details(client: httpx.AsyncClient, rng: random.Random, options) -> httpx.Response:
+    return await client.get("/cart/details", params={"user_id": rng.randint(1, options.users)})
+
+
+async def summary(client: httpx.AsyncClient, rng: random.Random, options) -> httpx.Response:
+    return await client.get("/cart/summary", params={"user_id": rng.randint(1, options.users)})
+
+
+SCENARIOS = {"browse": browse, "search": search, "add": add, "details": details, "summary": summary}
+
+
+async def drive(client: httpx.AsyncClient, options) -> dict:
+    """Run the traffic mix with `concurrency` workers for `seconds`. Returns per-scenario latencies and errors."""
+    names = list(options.mix)
+    weights = [options.mix[name] for name in names]
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+
+    # Warm-up (connection pools, SQLite page cache, catalog cache), not measured
+    warmup_rng = random.Random(options.seed)
+    for _ in range(20):
+        for name in names:
+            await SCENARIOS[name](client, warmup_rng, options)
+
+    deadline = time.perf_counter() + options.seconds
+
+    async def worker(index: int):
+        rng = random.Random(options.seed * 1000 + index)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await SCENARIOS[name](client, rng, options)
+                failed = response.status_code >= 500
+            except httpx.HTTPError:
+                failed = True
+            if failed:
+                errors[name] += 1
+            else:
+                latencies[name].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(options.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name in names:
+        values = latencies[name]
+        if len(values) < 2:
+            continue
+        cuts = statistics.quantiles(values, n=100, method="inclusive")
+        results[name] = {
+            "requests": len(values),
+            "throughput": len(values) / elapsed,
+            "p50_ms": cuts[49] * 1000,
+            "p95_ms": cuts[94] * 1000,
+            "p99_ms": cuts[98] * 1000,
+            "errors": errors[name],
+        }
+    return results
+
+
+async def run_in_process(options) -> dict:
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return await drive(client, options)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_uvicorn(options) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(options.workers), "--log-level", "warning", "--no-access-log"],
+        env=os.environ.copy()
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=options.concurrency, max_keepalive_connections=options.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            for _ in range(300):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    if server.poll() is not None:
+                        raise SystemExit("uvicorn exited during startup")
+                    await asyncio.sleep(0.1)
+            else:
+                raise SystemExit("uvicorn did not start")
+            return await drive(client, options)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Scenarios slower than the baseline by more than `tolerance` (fraction)."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']:.0f} -> {result['throughput']:.0f} req/s")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the API on a synthetic catalog")
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help=f"scenario weights, default {DEFAULT_MIX}")
+    parser.add_argument("--server", choices=("in-process", "uvicorn"), default="in-process")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (--server uvicorn)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", type=Path, help="compare against this baseline file")
+    parser.add_argument("--save-baseline", type=Path, help="store the results as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs the baseline, default 0.2 (20%%)")
+    options = parser.parse_args()
+    if isinstance(options.mix, str):
+        options.mix = parse_mix(options.mix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Must be set before app modules are imported: they build their engines on import
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        os.environ["PROFILING_ENABLED"] = "0"
+
+        started = time.perf_counter()
+        seed_database(options.products, options.users, options.seed)
+        print(f"seeded {options.products} products, {options.users} users in {time.perf_counter() - started:.1f}s")
+
+        runner = run_uvicorn if options.server == "uvicorn" else run_in_process
+        results = asyncio.run(runner(options))
+
+    print(f"\n{options.server}, concurrency {options.concurrency}, {options.seconds:g}s")
+    print(f"{'scenario':<10}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<10}{result['requests']:>10}{result['throughput']:>10.1f}{result['p50_ms']:>10.1f}"
+            f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['errors']:>8}"
+        )
+    total = sum(result["throughput"] for result in results.values())
+    print(f"{'total':<10}{'':>10}{total:>10.1f}")
+
+    report = {
+        "options": {key: value for key, value in vars(options).items() if key not in ("baseline", "save_baseline")},
+        "results": results,
+    }
+    if options.save_baseline:
+        options.save_baseline.write_text(json.dumps(report, indent=2, default=str))
+        print(f"\nbaseline saved to {options.save_baseline}")
+
+    if options.baseline:
+        baseline = json.loads(options.baseline.read_text())
+        if baseline.get("options") != json.loads(json.dumps(report["options"], default=str)):
+            print("\nwarning: the baseline was recorded with different options")
+        regressions = compare(results, baseline, options.tolerance)
+        if regressions:
+            print(f"\nREGRESSIONS (beyond {options.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nno regression beyond {options.tolerance:.0%} vs {options.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Concurrency stress check for POST /cart/add.
+
+Seeds a throwaway SQLite database, then fires hundreds of concurrent
+add-to-bag calls, each in its own AsyncSession like an API request, at a
+handful of bag lines (several users, several products, both hitting the
+same line and creating it for the first time). Afterwards every line must
+hold exactly one CartItem row whose quantity is the sum of all the adds:
+no lost increments, no duplicate rows, without any application-level lock.
+
+Run from the almirah_backend directory:
+    python -m benchmarks.cart_concurrent_adds [--adds 500] [--concurrency 64]
+Exits with status 1 if an add failed (e.g. "database is locked"), an
+increment was lost or a duplicate row appeared.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import SQLModel, Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.database import make_async_engine, make_engine, to_async_url
+from app.models.cart_item import CartItem
+from app.models.product import Product
+from app.models.user import User
+from app.services.cart_service import CartService
+
+USERS = 3
+PRODUCTS = 3
+
+
+def seed(engine) -> None:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            Product(brand="Brand", name=f"Product {i}", price=100.0, image_url=f"/static/images/{i}.png", category="Tops")
+            for i in range(PRODUCTS)
+        )
+        session.add_all(User(name=f"User {i}") for i in range(USERS))
+        session.commit()
+
+
+async def run(async_engine, adds: list[tuple[int, int, int]], concurrency: int) -> list[tuple[int, int, int]]:
+    """
+    Apply every (user_id, product_id, quantity) add concurrently, once each
+    (no retries). Returns the adds that failed with a database error, e.g.
+    "database is locked": through the API each would be a 500.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = []
+
+    async def add(user_id: int, product_id: int, quantity: int):
+        async with semaphore:
+            try:
+                async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                    await CartService.add_item(session, user_id, product_id, quantity)
+            except OperationalError as error:
+                failures.append((user_id, product_id, quantity))
+                print(f"user {user_id} product {product_id}: {error.orig}")
+
+    await asyncio.gather(*(add(*item) for item in adds))
+    return failures
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent POST /cart/add must never lose an increment")
+    parser.add_argument("--adds", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    adds = [(rng.randint(1, USERS), rng.randint(1, PRODUCTS), rng.randint(1, 3)) for _ in range(args.adds)]
+    expected = Counter()
+    for user_id, product_id, quantity in adds:
+        expected[(user_id, product_id)] += quantity
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        engine = make_engine(url, echo=False)
+        # create_all also builds the unique (user_id, product_id) index the upsert relies on
+        seed(engine)
+
+        async_engine = make_async_engine(to_async_url(url), echo=False)
+        started = time.perf_counter()
+        failures = await run(async_engine, adds, args.concurrency)
+        elapsed = time.perf_counter() - started
+        await async_engine.dispose()
+
+        with Session(engine) as session:
+            rows = session.exec(select(CartItem.user_id, CartItem.product_id, CartItem.quantity)).all()
+        engine.dispose()
+
+    print(f"{len(adds)} adds, concurrency {args.concurrency}: {elapsed:.2f}s ({len(adds) / elapsed:.0f} adds/s), {len(failures)} failed")
+    failed = bool(failures)
+    lines = Counter((user_id, product_id) for user_id, product_id, _ in rows)
+    for line, count in sorted(lines.items()):
+        if count > 1:
+            print(f"user {line[0]} product {line[1]}: {count} rows")
+            failed = True
+    actual = {(user_id, product_id): quantity for user_id, product_id, quantity in rows}
+    for line, quantity in sorted(expected.items()):
+        status = "ok" if actual.get(line) == quantity else "LOST INCREMENTS"
+        failed = failed or status != "ok"
+        print(f"user {line[0]} product {line[1]}: expected {quantity:4d}, got {actual.get(line, 0):4d}  {status}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
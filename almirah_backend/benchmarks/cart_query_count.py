@@ -0,0 +1,118 @@
+"""
+Query-count regression check for cart hydration.
+
+Seeds a throwaway SQLite database, fills bags of different sizes and counts
+the SQL statements issued by CartService.get_bag_details and
+CartService.get_cart_items_with_products. Both must issue the same number of
+queries no matter how many lines the bag has (no N+1).
+
+Run from the almirah_backend directory:
+    python -m benchmarks.cart_query_count
+Exits with status 1 if the query count grows with the bag size.
+"""
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlmodel import SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.database import make_async_engine, make_engine, to_async_url
+from app.models.cart_item import CartItem
+from app.models.product import Product
+from app.models.user import User
+from app.services.cart_service import CartService
+
+BAG_SIZES = [1, 10, 100]
+
+
+class QueryCounter:
+    """Counts statements executed on an engine while active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        self.count = 0
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def seed(session: Session) -> dict[int, int]:
+    """Create one user per bag size. Returns {bag_size: user_id}."""
+    products = [
+        Product(
+            brand=f"Brand {i % 7}",
+            name=f"Product {i}",
+            price=100.0 + i,
+            discount_price=(90.0 + i) if i % 2 else None,
+            image_url=f"/static/images/{i}.png",
+            category="Benchmark",
+        )
+        for i in range(max(BAG_SIZES))
+    ]
+    session.add_all(products)
+    session.commit()
+
+    users = {}
+    for size in BAG_SIZES:
+        user = User(name=f"Bag of {size}")
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+        session.add_all(
+            CartItem(user_id=user.id, product_id=product.id, quantity=2)
+            for product in products[:size]
+        )
+        session.commit()
+        users[size] = user.id
+    return users
+
+
+async def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        engine = make_engine(url, echo=False)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            users = seed(session)
+        engine.dispose()
+
+        async_engine = make_async_engine(to_async_url(url), echo=False)
+        results = {}
+        for name, call in [
+            ("get_bag_details", CartService.get_bag_details),
+            ("get_cart_items_with_products", CartService.get_cart_items_with_products),
+        ]:
+            counts = []
+            for size in BAG_SIZES:
+                # Fresh session so nothing is served from the identity map
+                async with AsyncSession(async_engine) as session:
+                    with QueryCounter(async_engine.sync_engine) as counter:
+                        await call(session, users[size])
+                counts.append(counter.count)
+            results[name] = counts
+            print(f"{name}: " + ", ".join(
+                f"{size} items -> {count} queries" for size, count in zip(BAG_SIZES, counts)
+            ))
+
+        await async_engine.dispose()
+
+    if any(len(set(counts)) != 1 for counts in results.values()):
+        print("FAIL: query count grows with bag size (N+1)")
+        return 1
+    print("OK: query count is constant")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
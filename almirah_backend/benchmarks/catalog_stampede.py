@@ -0,0 +1,125 @@
+"""
+Stampede test of the catalog read path (sale start: everyone opens the same page).
+
+Seeds a synthetic catalog into a throwaway SQLite database (same generator as
+benchmarks.api_load), then fires --waves waves of --clients identical
+GET /products/?category=... requests at once, each wave on a cold cache (the
+catalog is invalidated first, as a product write would). Every wave is run
+with request coalescing off and on (CatalogCache.coalesce), and the DB
+queries issued per wave and the request latency are compared.
+
+Checks that with coalescing every wave runs exactly one query and every
+client gets the same body.
+
+Run from the almirah_backend directory:
+    python -m benchmarks.catalog_stampede [--products 20000] [--clients 500] [--waves 5]
+Exits with status 1 on errors, differing bodies or more than one query per coalesced wave.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+
+async def wave(client: httpx.AsyncClient, clients: int, params: dict) -> tuple[list[float], list[httpx.Response]]:
+    """`clients` identical requests started together; returns their latencies and responses."""
+    start = asyncio.Event()
+
+    async def one() -> tuple[float, httpx.Response]:
+        await start.wait()
+        started = time.perf_counter()
+        response = await client.get("/products/", params=params)
+        return time.perf_counter() - started, response
+
+    tasks = [asyncio.create_task(one()) for _ in range(clients)]
+    await asyncio.sleep(0)
+    start.set()
+    results = await asyncio.gather(*tasks)
+    return [latency for latency, _ in results], [response for _, response in results]
+
+
+async def run(options) -> dict:
+    from app.core.metrics import record_statements
+    from app.main import app
+    from app.services.catalog_cache import catalog_cache
+    from benchmarks.api_load import CATEGORIES
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+            for coalesce in (False, True):
+                catalog_cache.coalesce = coalesce
+                latencies, queries, errors, distinct_bodies = [], [], 0, 0
+                started = time.perf_counter()
+                for index in range(options.waves):
+                    params = {"category": CATEGORIES[index % len(CATEGORIES)], "sort": "-rating", "limit": 50}
+                    catalog_cache.invalidate()
+                    # Counts the statements of this wave's requests only (not the stock sweeper's)
+                    with record_statements() as statements:
+                        wave_latencies, responses = await wave(client, options.clients, params)
+                    queries.append(len(statements))
+                    latencies.extend(wave_latencies)
+                    errors += sum(response.status_code != 200 for response in responses)
+                    distinct_bodies = max(distinct_bodies, len({response.content for response in responses}))
+
+                cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+                results["on" if coalesce else "off"] = {
+                    "seconds": time.perf_counter() - started,
+                    "queries_per_wave": statistics.mean(queries),
+                    "max_queries_per_wave": max(queries),
+                    "p50_ms": cuts[49] * 1000,
+                    "p99_ms": cuts[98] * 1000,
+                    "errors": errors,
+                    "distinct_bodies": distinct_bodies,
+                }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Catalog stampede test with and without request coalescing")
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, default=500, help="identical requests per wave")
+    parser.add_argument("--waves", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Must be set before app modules are imported: they build their engines on import
+        os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        os.environ["PROFILING_ENABLED"] = "0"
+
+        from benchmarks.api_load import seed_database
+        seed_database(options.products, 1, options.seed)
+        results = asyncio.run(run(options))
+
+    print(f"{options.waves} waves of {options.clients} identical requests, cold cache each wave")
+    print(f"{'coalescing':<12}{'queries/wave':>14}{'p50 ms':>10}{'p99 ms':>10}{'total s':>10}{'errors':>8}")
+    for mode, result in results.items():
+        print(
+            f"{mode:<12}{result['queries_per_wave']:>14.1f}{result['p50_ms']:>10.1f}"
+            f"{result['p99_ms']:>10.1f}{result['seconds']:>10.2f}{result['errors']:>8}"
+        )
+
+    failures = []
+    for mode, result in results.items():
+        if result["errors"]:
+            failures.append(f"{result['errors']} failed requests with coalescing {mode}")
+        if result["distinct_bodies"] > 1:
+            failures.append(f"clients of one wave got different bodies with coalescing {mode}")
+    if results["on"]["max_queries_per_wave"] > 1:
+        failures.append(f"coalesced waves ran up to {results['on']['max_queries_per_wave']} queries (expected 1)")
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
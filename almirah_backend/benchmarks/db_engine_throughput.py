@@ -0,0 +1,178 @@
+"""
+Read/write throughput of the database engine under concurrent API traffic.
+
+Seeds one synthetic catalog (Category rows, products, users with a few
+items in their bags, the app's full schema with its indexes and triggers)
+and runs the same mixed workload against copies of it with two engines:
+  - "legacy": the engine the app used to build, i.e.
+        create_engine(url, echo=True, connect_args={"check_same_thread": False})
+    on the async driver: statement logging on, default pool, no PRAGMAs
+    (so the rollback journal SQLite starts with)
+  - "tuned":  make_async_engine() defaults (WAL, synchronous=NORMAL, mmap,
+    cache, busy_timeout, sized pool, no echo)
+The legacy engine's log lines are formatted as before but written to
+os.devnull, so the terminal does not slow it down further than it did.
+
+Concurrent asyncio workers, each with its own AsyncSession like an API
+request, call the services behind the endpoints (the catalog read cache
+is bypassed, every read reaches the database):
+  browse   ProductService.list_products (category filter, random sort)
+  lookup   ProductService.get_products (10 ids)
+  details  CartService.get_bag_details
+  summary  CartService.get_bag_summary
+  add      CartService.add_item (--write-ratio of the operations)
+
+Each run measures both engines, alternating which goes first; the report
+shows every run's speedup and the median/min/max over --runs runs, since
+one ratio on a shared machine is mostly noise.
+
+Run from the almirah_backend directory:
+    python -m benchmarks.db_engine_throughput [--concurrency 16] [--seconds 5] [--write-ratio 0.2] [--runs 5]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.api_load import CATEGORIES, seed_database
+
+PRODUCTS = 2000
+USERS = 200
+
+# Relative weights of the read operations (writes are --write-ratio of the total)
+READ_MIX = {"browse": 40, "lookup": 20, "details": 25, "summary": 15}
+
+
+def legacy_engine(url: str):
+    """The original engine (app/core/database.py before the tuning), on aiosqlite."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.core.database import to_async_url
+
+    async_engine = create_async_engine(to_async_url(url), echo=True, connect_args={"check_same_thread": False})
+    # echo=True adds a stdout handler: keep the logging work, drop the output
+    devnull = open(os.devnull, "w")
+    for handler in logging.getLogger("sqlalchemy.engine.Engine").handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(devnull)
+    return async_engine
+
+
+def tuned_engine(url: str):
+    from app.core.database import make_async_engine, to_async_url
+
+    return make_async_engine(to_async_url(url), echo=False)
+
+
+ENGINES = {"legacy": legacy_engine, "tuned": tuned_engine}
+
+
+async def run(async_engine, concurrency: int, seconds: float, write_ratio: float) -> dict:
+    from fastapi import HTTPException
+    from sqlalchemy.exc import OperationalError
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from app.services.cart_service import CartService
+    from app.services.product_service import ProductService, ProductSort
+
+    sorts = list(ProductSort)
+    reads = {
+        "browse": lambda session, rng: ProductService.list_products(
+            session, limit=20, sort=rng.choice(sorts), category_id=rng.randint(1, len(CATEGORIES))
+        ),
+        "lookup": lambda session, rng: ProductService.get_products(session, rng.sample(range(1, PRODUCTS + 1), 10)),
+        "details": lambda session, rng: CartService.get_bag_details(session, rng.randint(1, USERS)),
+        "summary": lambda session, rng: CartService.get_bag_summary(session, rng.randint(1, USERS)),
+    }
+    read_names, read_weights = list(READ_MIX), list(READ_MIX.values())
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+
+    async def worker(seed_value: int):
+        rng = random.Random(seed_value)
+        while time.perf_counter() < deadline:
+            try:
+                async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                    if rng.random() < write_ratio:
+                        await CartService.add_item(session, rng.randint(1, USERS), rng.randint(1, PRODUCTS), 1)
+                        counts["writes"] += 1
+                    else:
+                        await reads[rng.choices(read_names, read_weights)[0]](session, rng)
+                        counts["reads"] += 1
+            except (OperationalError, HTTPException):
+                # "database is locked" once the busy timeout (and add_item's retries) run out
+                counts["errors"] += 1
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return {key: value / seconds for key, value in counts.items()}
+
+
+def seed_template(tmp: Path) -> Path:
+    """Seed the catalog once; each run starts from a copy of the file."""
+    template = tmp / "template.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{template}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["DATABASE_ECHO"] = "0"
+    seed_database(PRODUCTS, USERS, seed=42)
+
+    from app.core.database import async_engine, engine
+
+    engine.dispose()
+    async_engine.sync_engine.dispose()
+    # The app engine left the file in WAL mode, which is persistent: put it
+    # back to the rollback journal the legacy engine would find
+    connection = sqlite3.connect(template)
+    connection.execute("PRAGMA journal_mode=DELETE")
+    connection.close()
+    return template
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent API traffic: legacy vs tuned SQLite engine")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    ratios = []
+    with tempfile.TemporaryDirectory() as tmp:
+        template = seed_template(Path(tmp))
+        for run_index in range(args.runs):
+            order = ["legacy", "tuned"] if run_index % 2 == 0 else ["tuned", "legacy"]
+            results = {}
+            for name in order:
+                database = Path(tmp) / f"{name}-{run_index}.db"
+                shutil.copyfile(template, database)
+                async_engine = ENGINES[name](f"sqlite:///{database}")
+                results[name] = await run(async_engine, args.concurrency, args.seconds, args.write_ratio)
+                await async_engine.dispose()
+            for name in ("legacy", "tuned"):
+                r = results[name]
+                print(
+                    f"run {run_index + 1} {name:>6}: {r['reads']:8.1f} reads/s  {r['writes']:8.1f} writes/s  "
+                    f"{r['reads'] + r['writes']:8.1f} total/s  {r['errors']:6.1f} errors/s"
+                )
+            legacy_total = results["legacy"]["reads"] + results["legacy"]["writes"]
+            tuned_total = results["tuned"]["reads"] + results["tuned"]["writes"]
+            if legacy_total:
+                ratios.append(tuned_total / legacy_total)
+                print(f"run {run_index + 1} speedup: {ratios[-1]:.2f}x")
+
+    if ratios:
+        print(
+            f"speedup over {len(ratios)} runs: median {statistics.median(ratios):.2f}x  "
+            f"min {min(ratios):.2f}x  max {max(ratios):.2f}x  "
+            f"({', '.join(f'{ratio:.2f}x' for ratio in ratios)})"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
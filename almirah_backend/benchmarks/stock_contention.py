@@ -0,0 +1,148 @@
+"""
+Load test for stock reservations on one hot product (flash sale).
+
+Seeds a throwaway SQLite database with a product that has --stock units and
+--buyers users who each have that product (plus an untracked one) in their
+bag, then has every buyer reserve their bag at once (POST /cart/reservation),
+--concurrency at a time. Checks that:
+  - exactly `stock` buyers got a reservation and the rest a 409 (no oversell),
+  - the stock ends at 0 and never goes negative,
+  - the expiry sweeper puts every reserved unit back on sale,
+and reports the p50/p95/p99 latency of the reservation calls.
+
+Run from the almirah_backend directory:
+    python -m benchmarks.stock_contention [--buyers 1000] [--stock 100] [--concurrency 100] [--max-p99-ms 2000]
+Exits with status 1 on oversell, lost stock or a p99 above --max-p99-ms.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+from sqlmodel import SQLModel, Session, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.database import make_async_engine, make_engine, to_async_url
+from app.models.cart_item import CartItem
+from app.models.product import Product
+from app.models.stock_reservation import StockReservation
+from app.models.user import User
+from app.services.inventory_service import InventoryService
+
+HOT_PRODUCT_ID = 1
+
+
+def seed(engine, buyers: int, stock: int) -> None:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Product(brand="Brand", name="Hot sneaker", price=100.0, image_url="/static/images/1.png", category="Shoes", stock=stock))
+        session.add(Product(brand="Brand", name="Socks", price=5.0, image_url="/static/images/2.png", category="Shoes"))
+        session.add_all(User(name=f"User {i}") for i in range(buyers))
+        session.commit()
+        session.add_all(
+            CartItem(user_id=user_id, product_id=product_id, quantity=1)
+            for user_id in range(1, buyers + 1)
+            for product_id in (HOT_PRODUCT_ID, 2)
+        )
+        session.commit()
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[round(fraction * 100) - 1]
+
+
+async def run(async_engine, buyers: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    outcome = {"reserved": 0, "sold_out": 0, "lock_errors": 0}
+    latencies = []
+
+    async def reserve(user_id: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                    await InventoryService.reserve_bag(session, user_id)
+                outcome["reserved"] += 1
+            except HTTPException:
+                outcome["sold_out"] += 1
+            except OperationalError:
+                # "database is locked" once the busy timeout runs out
+                outcome["lock_errors"] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(reserve(user_id) for user_id in range(1, buyers + 1)))
+    outcome["elapsed"] = time.perf_counter() - started
+    outcome["latencies"] = latencies
+    return outcome
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent reservations of one hot product must never oversell")
+    parser.add_argument("--buyers", type=int, default=1000)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--max-p99-ms", type=float, default=2000)
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{Path(tmp) / 'bench.db'}"
+        engine = make_engine(url, echo=False)
+        seed(engine, args.buyers, args.stock)
+
+        async_engine = make_async_engine(to_async_url(url), echo=False)
+        result = await run(async_engine, args.buyers, args.concurrency)
+
+        with Session(engine) as session:
+            stock_left = session.get(Product, HOT_PRODUCT_ID).stock
+            reserved = session.exec(
+                select(func.coalesce(func.sum(StockReservation.quantity), 0)).where(StockReservation.product_id == HOT_PRODUCT_ID)
+            ).one()
+            # Expire every reservation, as if the checkout window had passed
+            session.exec(update(StockReservation).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+            session.commit()
+
+        async with AsyncSession(async_engine) as session:
+            released = await InventoryService.release_expired(session)
+        await async_engine.dispose()
+
+        with Session(engine) as session:
+            stock_after_sweep = session.get(Product, HOT_PRODUCT_ID).stock
+        engine.dispose()
+
+    latencies_ms = [latency * 1000 for latency in result["latencies"]]
+    p50, p95, p99 = (percentile(latencies_ms, fraction) for fraction in (0.50, 0.95, 0.99))
+    print(
+        f"{args.buyers} buyers, {args.stock} units, concurrency {args.concurrency}: "
+        f"{result['elapsed']:.2f}s ({args.buyers / result['elapsed']:.0f} reservations/s)"
+    )
+    print(f"reserved {result['reserved']}, sold out {result['sold_out']}, lock errors {result['lock_errors']}")
+    print(f"latency p50 {p50:.1f} ms  p95 {p95:.1f} ms  p99 {p99:.1f} ms")
+    print(f"stock left {stock_left}, units reserved {reserved}; after sweep: {released} released, stock {stock_after_sweep}")
+
+    expected_reserved = min(args.stock, args.buyers - result["lock_errors"])
+    checks = [
+        ("no oversell", result["reserved"] <= args.stock and stock_left >= 0),
+        ("stock conserved", stock_left + reserved == args.stock),
+        ("every unit sold", result["reserved"] == expected_reserved),
+        ("sweeper restocked", stock_after_sweep == args.stock),
+        (f"p99 <= {args.max_p99_ms:.0f} ms", p99 <= args.max_p99_ms),
+    ]
+    for name, ok in checks:
+        print(f"{name}: {'ok' if ok else 'FAILED'}")
+        failed = failed or not ok
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())